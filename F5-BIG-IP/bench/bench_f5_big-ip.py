@@ -0,0 +1,131 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim: expandtab sw=4 ts=4:
+"""
+Benchmark of check_f5_big-ip.py modes against the SNMP replay agent: runs
+each mode as a subprocess, as Nagios would, and reports its wall time, the
+number of SNMP PDUs it sent, and its peak resident memory.
+Published under MIT license
+"""
+import argparse, json, multiprocessing, os, shutil, subprocess, sys, tempfile, time
+import snmp_replay_agent
+
+__author__ = 'Eric Belhomme'
+__contact__ = 'rico-github@ricozome.net'
+__license__ = 'MIT'
+
+
+benchDir = os.path.dirname(os.path.abspath(__file__))
+
+# mode name -> plugin arguments
+benchModes = {
+    'health':       ['-m', 'health'],
+    'sessions':     ['-m', 'sessions'],
+    'all-globals':  ['-m', 'all-globals'],
+    'enumvs':       ['-m', 'enumvs'],
+    'vsstats':      ['-m', 'vsstats', '-x', '/Common/vs_1'],
+    'vsstats-re':   ['-m', 'vsstats', '-x', '^/Common/vs_1[0-9]$'],
+    'nodestats':    ['-m', 'nodestats'],
+    'poolstats':    ['-m', 'poolstats'],
+}
+
+
+def serve_agent(options, conn, counter):
+    """
+    Agent process: builds the MIB store and serves it until terminated. It
+    runs apart from the benchmark process, so that the plugin subprocesses do
+    not inherit (and account for) its memory.
+    """
+    start = time.time()
+    store = snmp_replay_agent.build_store(options)
+    agent = snmp_replay_agent.ReplayAgent(store, counter=counter)
+    conn.send((agent.address, len(store), time.time() - start))
+    conn.close()
+    agent.serve_forever()
+
+
+def start_agent(options):
+    counter = multiprocessing.Value('L', 0)
+    parent, child = multiprocessing.Pipe()
+    proc = multiprocessing.Process(target=serve_agent, args=(options, child, counter))
+    proc.daemon = True
+    proc.start()
+    address, size, elapsed = parent.recv()
+    return proc, counter, address, size, elapsed
+
+
+def run_plugin(command):
+    """
+    Runs the plugin, and returns its exit code, wall time (s) and peak RSS
+    (KiB, from the child resource usage)
+    """
+    start = time.time()
+    proc = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    output = proc.stdout.read()
+    proc.stdout.close()
+    pid, status, rusage = os.wait4(proc.pid, 0)
+    elapsed = time.time() - start
+    proc.returncode = os.WEXITSTATUS(status) if os.WIFEXITED(status) else -os.WTERMSIG(status)
+    return proc.returncode, elapsed, rusage.ru_maxrss, output
+
+
+def bench(address, counter, modes, runs, plugin, extra):
+    results = []
+    for mode in modes:
+        statedir = tempfile.mkdtemp(prefix='bench_f5_')
+        command = [sys.executable, plugin, '-H', "{}:{}".format(*address), '-C', 'public',
+            '--state-dir', statedir, '--cache-dir', statedir] + benchModes[mode] + extra
+        for run in range(runs):
+            pdus = counter.value
+            retcode, elapsed, rss, output = run_plugin(command)
+            results.append({
+                'mode': mode,
+                'run': run + 1,
+                'retcode': retcode,
+                'wall': round(elapsed, 3),
+                'pdus': counter.value - pdus,
+                'rss_kb': rss,
+                'output_bytes': len(output),
+            })
+        shutil.rmtree(statedir, ignore_errors=True)
+    return results
+
+
+def print_results(results):
+    print("{:<12} {:>4} {:>5} {:>9} {:>7} {:>9} {:>10}".format(
+        'mode', 'run', 'exit', 'wall (s)', 'PDUs', 'RSS (MiB)', 'output (B)'))
+    for r in results:
+        print("{:<12} {:>4} {:>5} {:>9.3f} {:>7} {:>9.1f} {:>10}".format(
+            r['mode'], r['run'], r['retcode'], r['wall'], r['pdus'], r['rss_kb'] / 1024.0, r['output_bytes']))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark check_f5_big-ip.py modes against a replayed appliance')
+    snmp_replay_agent.add_store_arguments(parser)
+    parser.set_defaults(vs=10000, nodes=50000, pools=10000)
+    parser.add_argument('-m', '--modes', type=str, help='comma-separated modes to run ({})'.format(
+        ', '.join(sorted(benchModes))), default='health,sessions,enumvs,vsstats,nodestats')
+    parser.add_argument('-n', '--runs', type=int, help='runs per mode', default=3)
+    parser.add_argument('--plugin', type=str, help='plugin to benchmark',
+        default=os.path.join(benchDir, '..', 'check_f5_big-ip.py'))
+    parser.add_argument('--plugin-args', type=str, help='additional plugin arguments (eg. "-r 50")', default='')
+    parser.add_argument('--json', type=str, help='also write results to this JSON file', default=None)
+    args = parser.parse_args()
+
+    modes = args.modes.split(',')
+    for mode in modes:
+        if mode not in benchModes:
+            parser.error("unknown mode '{}'".format(mode))
+
+    proc, counter, address, size, elapsed = start_agent(args)
+    print("Replaying {} OIDs on {}:{} (loaded in {:.1f}s)".format(size, address[0], address[1], elapsed))
+    try:
+        results = bench(address, counter, modes, args.runs, args.plugin, args.plugin_args.split())
+    finally:
+        proc.terminate()
+
+    print_results(results)
+    if args.json:
+        with open(args.json, 'w') as fd:
+            json.dump({'vs': args.vs, 'nodes': args.nodes, 'pools': args.pools, 'members': args.members,
+                'results': results}, fd, indent=2)
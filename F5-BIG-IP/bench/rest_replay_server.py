@@ -0,0 +1,302 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim: expandtab sw=4 ts=4:
+"""
+Minimal stand-in of the BIG-IP iControl REST API, to test and benchmark the
+REST backend of check_f5_big-ip.py without a real BIG-IP: serves recorded
+statistics responses, or synthetic ones, over plain HTTP with keep-alive.
+Published under MIT license
+"""
+import argparse, base64, json, os, re, sys, threading
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+    from urllib.parse import unquote, urlparse
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+    from urllib import unquote
+    from urlparse import urlparse
+
+__author__ = 'Eric Belhomme'
+__contact__ = 'rico-github@ricozome.net'
+__license__ = 'MIT'
+
+
+restBase = 'https://localhost/mgmt/tm/'
+
+# statistics collections polled by the plugin, served from `<name>.json` of
+# the responses directory when recorded there
+restCollections = {
+    'ltm/virtual/stats': 'ltm_virtual_stats',
+    'ltm/node/stats': 'ltm_node_stats',
+    'ltm/pool/stats': 'ltm_pool_stats',
+    'sys/hardware': 'sys_hardware',
+    'ltm/profile/http/stats': 'ltm_profile_http_stats',
+    'sys/tmm-info/stats': 'sys_tmm-info_stats',
+    'sys/traffic/stats': 'sys_traffic_stats',
+}
+
+# statistics of a single object, eg. ltm/virtual/~Common~www_vs/stats
+re_object_stats = re.compile(r'^(ltm/virtual|ltm/node)/([^/]+)/stats$')
+
+
+##### synthetic responses
+
+def _url(name):
+    # '/Common/www_vs' is addressed as '~Common~www_vs'
+    return name.replace('/', '~')
+
+
+def _nested(kind, path, entries):
+    """
+    Returns a `nestedStats` item of `entries`, as found in stats collections
+    """
+    return restBase + path, {'nestedStats': {'kind': kind, 'selfLink': restBase + path + '?ver=13.1.1',
+        'entries': entries}}
+
+
+def _collection(kind, path, items):
+    return {'kind': kind, 'selfLink': restBase + path + '?ver=13.1.1', 'entries': dict(items)}
+
+
+def _avail(down):
+    return {'description': 'offline' if down else 'available'}
+
+
+def virtual_stats(options):
+    """
+    Returns `ltm/virtual/stats` for `--vs` VirtualServers, with the same
+    counters as snmp_replay_agent.py synthesized ones
+    """
+    items = []
+    for i in range(options.vs):
+        name = "/Common/vs_{}".format(i)
+        items.append(_nested('tm:ltm:virtual:virtualstats', "ltm/virtual/{}/stats".format(_url(name)), {
+            'tmName': {'description': name},
+            'status.availabilityState': _avail(i % 97 == 0),
+            'status.enabledState': {'description': 'enabled'},
+            'clientside.bitsIn': {'value': i * 1048576 * 8},
+            'clientside.bitsOut': {'value': i * 4194304 * 8},
+            'clientside.curConns': {'value': i % 5000},
+            'clientside.maxConns': {'value': i % 5000 + 100},
+            'clientside.totConns': {'value': i * 1000},
+        }))
+    return _collection('tm:ltm:virtual:virtualcollectionstats', 'ltm/virtual/stats', items)
+
+
+def node_stats(options):
+    items = []
+    for i in range(options.nodes):
+        name = "/Common/node_{}".format(i)
+        items.append(_nested('tm:ltm:node:nodestats', "ltm/node/{}/stats".format(_url(name)), {
+            'tmName': {'description': name},
+            'addr': {'description': "10.{}.{}.{}".format(i >> 16 & 255, i >> 8 & 255, i & 255)},
+            'status.availabilityState': _avail(i % 101 == 0),
+            'serverside.bitsIn': {'value': i * 524288 * 8},
+            'serverside.bitsOut': {'value': i * 2097152 * 8},
+            'serverside.curConns': {'value': i % 3000},
+            'serverside.maxConns': {'value': i % 3000 + 50},
+            'serverside.totConns': {'value': i * 500},
+        }))
+    return _collection('tm:ltm:node:nodecollectionstats', 'ltm/node/stats', items)
+
+
+def pool_stats(options):
+    """
+    Returns `ltm/pool/stats?expandSubcollections=true`: pools statistics,
+    each one embedding the statistics of its members
+    """
+    items = []
+    for i in range(options.pools):
+        pool = "/Common/pool_{}".format(i)
+        path = "ltm/pool/{}".format(_url(pool))
+        members = []
+        for j in range(options.members):
+            node = "/Common/node_{}".format((i * options.members + j) % max(options.nodes, 1))
+            members.append(_nested('tm:ltm:pool:members:membersstats',
+                "{}/members/{}:80/stats".format(path, _url(node)), {
+                'poolName': {'description': pool},
+                'nodeName': {'description': node},
+                'port': {'value': 80},
+                'status.availabilityState': _avail((i + j) % 53 == 0),
+                'serverside.curConns': {'value': (i + j) % 200},
+            }))
+        members = _collection('tm:ltm:pool:members:memberscollectionstats', path + '/members/stats', members)
+        items.append(_nested('tm:ltm:pool:poolstats', path + '/stats', {
+            'tmName': {'description': pool},
+            'status.availabilityState': _avail(False),
+            restBase + path + '/members/stats': {'nestedStats': members},
+        }))
+    return _collection('tm:ltm:pool:poolcollectionstats', 'ltm/pool/stats', items)
+
+
+def hardware(options):
+    sensors = []
+    for sensor, values in (
+            ('chassis-power-supply-status-index', [{'status': {'description': 'up'}}] * 2),
+            ('chassis-temperature-status-index', [{'temperature': {'value': t}} for t in (31, 33, 29)]),
+            ('chassis-fan-status-index', [{'status': {'description': 'up'}}] * 4)):
+        indexes = []
+        for index, entries in enumerate(values, 1):
+            entries = dict(entries, index={'value': index})
+            indexes.append(_nested('tm:sys:hardware:hardwarestats', "sys/hardware/{}/{}".format(sensor, index), entries))
+        sensors.append((restBase + 'sys/hardware/' + sensor, {'nestedStats': {'entries': dict(indexes)}}))
+    return _collection('tm:sys:hardware:hardwarestats', 'sys/hardware', sensors)
+
+
+def http_stats(options):
+    return _collection('tm:ltm:profile:http:httpcollectionstats', 'ltm/profile/http/stats', [
+        _nested('tm:ltm:profile:http:httpstats', 'ltm/profile/http/~Common~http/stats', {
+            'tmName': {'description': '/Common/http'},
+            'numberReqs': {'value': 150000},
+        })])
+
+
+def tmm_stats(options):
+    return _collection('tm:sys:tmm-info:tmm-infocollectionstats', 'sys/tmm-info/stats', [
+        _nested('tm:sys:tmm-info:tmm-infostats', "sys/tmm-info/0.{}/stats".format(tmm), {
+            'tmmId': {'description': "0.{}".format(tmm)},
+            'memoryTotal': {'value': 2 * 1024 ** 3},
+            'memoryUsed': {'value': 768 * 1024 ** 2},
+        }) for tmm in range(4)])
+
+
+def traffic_stats(options):
+    return _collection('tm:sys:traffic:trafficstats', 'sys/traffic/stats', [
+        _nested('tm:sys:traffic:trafficstats', 'sys/traffic/stats', {
+            'clientSideTraffic.curConns': {'value': 12000},
+            'clientSideTraffic.maxConns': {'value': 150000},
+            'clientSideTraffic.totConns': {'value': 98000000},
+            'serverSideTraffic.curConns': {'value': 11000},
+            'serverSideTraffic.maxConns': {'value': 140000},
+            'serverSideTraffic.totConns': {'value': 97000000},
+        })])
+
+
+synthesizers = {
+    'ltm/virtual/stats': virtual_stats,
+    'ltm/node/stats': node_stats,
+    'ltm/pool/stats': pool_stats,
+    'sys/hardware': hardware,
+    'ltm/profile/http/stats': http_stats,
+    'sys/tmm-info/stats': tmm_stats,
+    'sys/traffic/stats': traffic_stats,
+}
+
+
+##### server
+
+class RestHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        if self.server.options.verbose:
+            BaseHTTPRequestHandler.log_message(self, format, *args)
+
+    def send_json(self, status, body):
+        if not isinstance(body, bytes):
+            body = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=UTF-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def authorized(self):
+        options = self.server.options
+        if options.username is None:
+            return True
+        credentials = "{}:{}".format(options.username, options.password or '').encode('utf-8')
+        return self.headers.get('Authorization') == 'Basic ' + base64.b64encode(credentials).decode('ascii')
+
+    def do_GET(self):
+        with self.server.lock:
+            self.server.requests += 1
+        if not self.authorized():
+            return self.send_json(401, {'code': 401, 'message': 'Authorization failed: user=admin resource=/mgmt/tm/',
+                'errorStack': [], 'apiError': 1})
+        path = urlparse(self.path).path
+        if not path.startswith('/mgmt/tm/'):
+            return self.send_json(404, {'code': 404, 'message': 'Public URI path not registered', 'errorStack': []})
+        path = unquote(path[len('/mgmt/tm/'):])
+        if path in restCollections:
+            return self.send_json(200, self.server.response(path))
+        match = re_object_stats.match(path)
+        if match:
+            body = self.server.object_stats(match.group(1), match.group(2))
+            if body is not None:
+                return self.send_json(200, body)
+            return self.send_json(404, {'code': 404, 'message': "Object not found - {}".format(match.group(2).replace('~', '/')),
+                'errorStack': [], 'apiError': 1})
+        self.send_json(404, {'code': 404, 'message': "Public URI path not registered: /mgmt/tm/{}".format(path),
+            'errorStack': []})
+
+
+class RestServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, options):
+        HTTPServer.__init__(self, address, RestHandler)
+        self.options = options
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.cache = {}
+
+    def collection(self, path):
+        """
+        Returns the decoded response of `path` collection, recorded in
+        `--responses` directory if any, else synthetic
+        """
+        with self.lock:
+            if path not in self.cache:
+                name = os.path.join(self.options.responses, restCollections[path] + '.json') \
+                    if self.options.responses else None
+                if name is not None and os.path.exists(name):
+                    with open(name) as fd:
+                        self.cache[path] = json.load(fd)
+                else:
+                    self.cache[path] = synthesizers[path](self.options)
+            return self.cache[path]
+
+    def response(self, path):
+        body = self.collection(path)
+        with self.lock:
+            if (path, 'json') not in self.cache:
+                self.cache[path, 'json'] = json.dumps(body).encode('utf-8')
+            return self.cache[path, 'json']
+
+    def object_stats(self, kind, name):
+        """
+        Returns the statistics of a single object, out of its collection
+        """
+        suffix = "/{}/{}/stats".format(kind, name)
+        for url, item in self.collection(kind + '/stats').get('entries', {}).items():
+            if url.split('?')[0].endswith(suffix):
+                return {'kind': item.get('nestedStats', {}).get('kind'), 'selfLink': url, 'entries': {url: item}}
+        return None
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Stand-in of BIG-IP iControl REST API serving recorded or synthetic statistics')
+    parser.add_argument('-l', '--listen', type=str, help='listen address', default='127.0.0.1')
+    parser.add_argument('-p', '--port', type=int, help='listen port', default=8080)
+    parser.add_argument('-d', '--responses', type=str, help='directory of recorded responses (eg. ltm_virtual_stats.json)', default=None)
+    parser.add_argument('--vs', type=int, help='number of synthesized VirtualServers', default=10)
+    parser.add_argument('--nodes', type=int, help='number of synthesized Nodes', default=20)
+    parser.add_argument('--pools', type=int, help='number of synthesized pools', default=5)
+    parser.add_argument('--members', type=int, help='number of members per synthesized pool', default=3)
+    parser.add_argument('-U', '--username', type=str, help='expected user (any credentials if not set)', default=None)
+    parser.add_argument('-P', '--password', type=str, help='expected password', default=None)
+    parser.add_argument('-v', '--verbose', help='log requests', action='store_true')
+    args = parser.parse_args()
+
+    server = RestServer((args.listen, args.port), args)
+    sys.stderr.write("Serving on http://{}:{}\n".format(*server.server_address))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        sys.stderr.write("{} requests served\n".format(server.requests))
@@ -0,0 +1,439 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim: expandtab sw=4 ts=4:
+"""
+Minimal SNMP v2c agent replaying recorded walks of F5 BIG-IP MIB tables, and
+able to synthesize large appliances (thousands of VirtualServers, Nodes and
+pool members) to benchmark check_f5_big-ip.py without a real BIG-IP.
+Published under MIT license
+"""
+import argparse, bisect, socket, threading
+
+__author__ = 'Eric Belhomme'
+__contact__ = 'rico-github@ricozome.net'
+__license__ = 'MIT'
+
+
+# BER tags
+tagInteger = 0x02
+tagOctetString = 0x04
+tagOid = 0x06
+tagSequence = 0x30
+tagIpAddress = 0x40
+tagCounter32 = 0x41
+tagGauge32 = 0x42
+tagTimeTicks = 0x43
+tagCounter64 = 0x46
+tagNoSuchInstance = 0x81
+tagEndOfMibView = 0x82
+pduGet = 0xa0
+pduGetNext = 0xa1
+pduResponse = 0xa2
+pduGetBulk = 0xa5
+
+# snmprec value tags (as recorded by snmpsim) -> BER tags
+snmprecTags = {
+    '2': tagInteger,
+    '4': tagOctetString,
+    '6': tagOid,
+    '64': tagIpAddress,
+    '65': tagCounter32,
+    '66': tagGauge32,
+    '67': tagTimeTicks,
+    '70': tagCounter64,
+}
+
+# keep responses under the UDP payload limit
+maxResponseSize = 65000
+
+
+##### BER encoding
+
+def _ber_length(length):
+    if length < 0x80:
+        return bytearray([length])
+    out = bytearray()
+    while length:
+        out.insert(0, length & 0xff)
+        length >>= 8
+    return bytearray([0x80 | len(out)]) + out
+
+
+def ber_tlv(tag, value):
+    return bytearray([tag]) + _ber_length(len(value)) + value
+
+
+def ber_integer(tag, value):
+    out = bytearray()
+    while True:
+        out.insert(0, value & 0xff)
+        value >>= 8
+        if (value == 0 and not out[0] & 0x80) or (value == -1 and out[0] & 0x80):
+            break
+    return ber_tlv(tag, out)
+
+
+def ber_unsigned(tag, value):
+    out = bytearray()
+    while True:
+        out.insert(0, value & 0xff)
+        value >>= 8
+        if value == 0:
+            break
+    if out[0] & 0x80:
+        out.insert(0, 0)
+    return ber_tlv(tag, out)
+
+
+def parse_oid(oid):
+    return tuple(int(x) for x in oid.strip('.').split('.'))
+
+
+def ber_oid(subids):
+    out = bytearray([subids[0] * 40 + subids[1]])
+    for subid in subids[2:]:
+        chunk = bytearray([subid & 0x7f])
+        subid >>= 7
+        while subid:
+            chunk.insert(0, 0x80 | (subid & 0x7f))
+            subid >>= 7
+        out += chunk
+    return ber_tlv(tagOid, out)
+
+
+def ber_value(tag, value):
+    """
+    Encodes a snmprec-like value of BER type `tag`
+    """
+    if tag == tagInteger:
+        return ber_integer(tag, int(value))
+    if tag in (tagCounter32, tagGauge32, tagTimeTicks, tagCounter64):
+        return ber_unsigned(tag, int(value))
+    if tag == tagOid:
+        return ber_oid(parse_oid(value))
+    if tag == tagIpAddress:
+        return ber_tlv(tag, bytearray(socket.inet_aton(value)))
+    if isinstance(value, bytearray):
+        return ber_tlv(tag, value)
+    return ber_tlv(tag, bytearray(value.encode('utf-8')))
+
+
+def ber_varbind(subids, value):
+    return bytes(ber_tlv(tagSequence, ber_oid(subids) + value))
+
+
+##### BER decoding
+
+def ber_decode(data, pos=0):
+    """
+    Decodes the TLV at `pos` of bytearray `data`. Returns (tag, value start,
+    value end)
+    """
+    tag = data[pos]
+    length = data[pos + 1]
+    pos += 2
+    if length & 0x80:
+        count = length & 0x7f
+        length = 0
+        for byte in data[pos:pos + count]:
+            length = (length << 8) | byte
+        pos += count
+    return tag, pos, pos + length
+
+
+def ber_children(data, start, end):
+    while start < end:
+        tag, vstart, vend = ber_decode(data, start)
+        yield tag, vstart, vend
+        start = vend
+
+
+def _decode_int(data, start, end):
+    value = 0
+    for byte in data[start:end]:
+        value = (value << 8) | byte
+    if end > start and data[start] & 0x80:
+        value -= 1 << (8 * (end - start))
+    return value
+
+
+def _decode_oid(data, start, end):
+    subids = [data[start] // 40, data[start] % 40]
+    value = 0
+    for byte in data[start + 1:end]:
+        value = (value << 7) | (byte & 0x7f)
+        if not byte & 0x80:
+            subids.append(value)
+            value = 0
+    return tuple(subids)
+
+
+##### MIB store
+
+def oid_key(subids):
+    """
+    Order-preserving compact key of an OID: each sub-identifier is stored as
+    its byte length followed by its big-endian bytes, so that comparing keys
+    compares OIDs numerically, at a fraction of the memory of int tuples.
+    """
+    out = bytearray()
+    for subid in subids:
+        chunk = bytearray()
+        while True:
+            chunk.insert(0, subid & 0xff)
+            subid >>= 8
+            if not subid:
+                break
+        out.append(len(chunk))
+        out += chunk
+    return bytes(out)
+
+
+class MibStore(object):
+    """
+    Sorted store of OIDs and their pre-encoded BER varbinds
+    """
+
+    def __init__(self):
+        self.data = {}
+        self.keys = None
+
+    def add(self, subids, tag, value):
+        self.data[oid_key(subids)] = ber_varbind(subids, ber_value(tag, value))
+        self.keys = None
+
+    def load_snmprec(self, path):
+        """
+        Loads a recorded walk in snmprec format: `oid|tag|value` lines, with
+        `4x` tag for hex-encoded octet strings
+        """
+        with open(path) as fd:
+            for line in fd:
+                line = line.rstrip('\n')
+                if not line or line.startswith('#'):
+                    continue
+                oid, tag, value = line.split('|', 2)
+                if tag == '4x':
+                    self.add(parse_oid(oid), tagOctetString, bytearray.fromhex(value))
+                else:
+                    self.add(parse_oid(oid), snmprecTags[tag], value)
+
+    def get(self, subids):
+        return self.data.get(oid_key(subids))
+
+    def getnext(self, key):
+        """
+        Returns the key and varbind following OID `key`, or None at the end of
+        the MIB
+        """
+        if self.keys is None:
+            self.keys = sorted(self.data)
+        pos = bisect.bisect_right(self.keys, key)
+        if pos >= len(self.keys):
+            return None
+        return self.keys[pos], self.data[self.keys[pos]]
+
+    def __len__(self):
+        return len(self.data)
+
+
+def _name_to_index(name):
+    return (len(name),) + tuple(ord(c) for c in name)
+
+
+def synthesize(store, vs=10000, nodes=50000, pools=10000, members=5):
+    """
+    Fills `store` with the tables and scalars polled by check_f5_big-ip.py,
+    for an appliance with `vs` VirtualServers, `nodes` Nodes and `pools`
+    pools of `members` members each
+    """
+    ltm = (1, 3, 6, 1, 4, 1, 3375, 2, 2)
+    system = (1, 3, 6, 1, 4, 1, 3375, 2, 1)
+    for i in range(vs):
+        name = "/Common/vs_{}".format(i)
+        index = _name_to_index(name)
+        store.add(ltm + (10, 13, 2, 1, 1) + index, tagOctetString, name)
+        store.add(ltm + (10, 13, 2, 1, 2) + index, tagInteger, 3 if i % 97 == 0 else 1)
+        store.add(ltm + (10, 2, 3, 1, 1) + index, tagOctetString, name)
+        store.add(ltm + (10, 2, 3, 1, 7) + index, tagCounter64, i * 1048576)
+        store.add(ltm + (10, 2, 3, 1, 9) + index, tagCounter64, i * 4194304)
+        store.add(ltm + (10, 2, 3, 1, 10) + index, tagCounter64, i % 5000)
+        store.add(ltm + (10, 2, 3, 1, 11) + index, tagCounter64, i * 1000)
+        store.add(ltm + (10, 2, 3, 1, 12) + index, tagCounter64, i % 1000)
+    store.add(ltm + (10, 1, 1, 0), tagInteger, vs)     # ltmVirtualServNumber
+    store.add(ltm + (10, 13, 1, 0), tagInteger, vs)    # ltmVsStatusNumber
+    for i in range(nodes):
+        name = "/Common/node_{}".format(i)
+        index = _name_to_index(name)
+        store.add(ltm + (4, 3, 2, 1, 3) + index, tagInteger, 3 if i % 101 == 0 else 1)
+        store.add(ltm + (4, 3, 2, 1, 7) + index, tagOctetString, name)
+        store.add(ltm + (4, 2, 3, 1, 4) + index, tagCounter64, i * 524288)
+        store.add(ltm + (4, 2, 3, 1, 6) + index, tagCounter64, i * 2097152)
+        store.add(ltm + (4, 2, 3, 1, 7) + index, tagCounter64, i % 3000)
+        store.add(ltm + (4, 2, 3, 1, 8) + index, tagCounter64, i * 500)
+        store.add(ltm + (4, 2, 3, 1, 9) + index, tagCounter64, i % 500)
+    for i in range(pools):
+        pool = "/Common/pool_{}".format(i)
+        for j in range(members):
+            node = "/Common/node_{}".format((i * members + j) % max(nodes, 1))
+            index = _name_to_index(pool) + _name_to_index(node) + (80,)
+            store.add(ltm + (5, 6, 2, 1, 1) + index, tagOctetString, pool)
+            store.add(ltm + (5, 6, 2, 1, 5) + index, tagInteger, 3 if (i + j) % 53 == 0 else 1)
+            store.add(ltm + (5, 4, 3, 1, 11) + index, tagCounter64, (i + j) % 200)
+    for table, values in (
+            ((3, 2, 2, 2, 1, 2), (1, 1)),           # sysChassisPowerSupplyStatus
+            ((3, 2, 3, 2, 1, 2), (31, 33, 29)),     # sysChassisTempTemperature
+            ((3, 2, 1, 2, 1, 2), (1, 1, 1, 1))):    # sysChassisFanStatus
+        for i, value in enumerate(values, 1):
+            store.add(system + table + (i,), tagInteger, value)
+    for subid, value in ((6, 150000), (7, 98000000), (8, 12000), (13, 140000), (14, 97000000),
+            (15, 11000), (44, 8 * 1024 ** 3), (45, 3 * 1024 ** 3), (56, 150000)):
+        store.add(system + (1, 2, 1, subid, 0), tagCounter64, value)
+    store.add((1, 3, 6, 1, 2, 1, 1, 3, 0), tagTimeTicks, 123456)    # sysUpTime
+
+
+##### agent
+
+class ReplayAgent(object):
+    """
+    SNMP v2c agent answering GET, GETNEXT and GETBULK requests from a
+    MibStore, counting the request PDUs it receives in `counter` (an object
+    with a `value` attribute, eg. a multiprocessing.Value)
+    """
+
+    def __init__(self, store, address='127.0.0.1', port=0, community=None, counter=None):
+        self.store = store
+        self.community = community
+        self.counter = counter
+        self.pdus = 0
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind((address, port))
+        self.sock.settimeout(0.2)
+        self.address = self.sock.getsockname()
+        self.running = False
+        self.thread = None
+
+    def _getnext(self, key, subids):
+        """
+        Returns the key and varbind following `key`, and whether the end of the
+        MIB was reached
+        """
+        found = self.store.getnext(key)
+        if found is None:
+            return key, ber_varbind(subids, ber_tlv(tagEndOfMibView, bytearray())), True
+        return found + (False,)
+
+    def handle(self, data):
+        data = bytearray(data)
+        tag, start, end = ber_decode(data)
+        fields = list(ber_children(data, start, end))
+        version = _decode_int(data, fields[0][1], fields[0][2])
+        community = bytes(data[fields[1][1]:fields[1][2]])
+        pdutype, pstart, pend = fields[2]
+        if version != 1 or (self.community is not None and community != self.community.encode('utf-8')):
+            return None
+        self.pdus += 1
+        if self.counter is not None:
+            self.counter.value += 1
+        reqid, field2, field3, vbl = list(ber_children(data, pstart, pend))
+        requested = []
+        for vtag, vstart, vend in ber_children(data, vbl[1], vbl[2]):
+            otag, ostart, oend = ber_decode(data, vstart)
+            requested.append(_decode_oid(data, ostart, oend))
+
+        varbinds = []
+        if pdutype == pduGet:
+            for subids in requested:
+                varbinds.append(self.store.get(subids) or
+                    ber_varbind(subids, ber_tlv(tagNoSuchInstance, bytearray())))
+        elif pdutype == pduGetNext:
+            for subids in requested:
+                varbinds.append(self._getnext(oid_key(subids), subids)[1])
+        elif pdutype == pduGetBulk:
+            nonrepeaters = _decode_int(data, field2[1], field2[2])
+            maxrepetitions = _decode_int(data, field3[1], field3[2])
+            for subids in requested[:nonrepeaters]:
+                varbinds.append(self._getnext(oid_key(subids), subids)[1])
+            repeaters = requested[nonrepeaters:]
+            cursors = [oid_key(subids) for subids in repeaters]
+            size = sum(len(vb) for vb in varbinds)
+            for repetition in range(maxrepetitions):
+                chunk = []
+                ended = True
+                for col, subids in enumerate(repeaters):
+                    cursors[col], varbind, end = self._getnext(cursors[col], subids)
+                    ended = ended and end
+                    chunk.append(varbind)
+                size += sum(len(vb) for vb in chunk)
+                if size > maxResponseSize:
+                    break
+                varbinds.extend(chunk)
+                if ended:
+                    break
+        else:
+            return None
+
+        pdu = ber_tlv(pduResponse, ber_integer(tagInteger, _decode_int(data, reqid[1], reqid[2])) +
+            ber_integer(tagInteger, 0) + ber_integer(tagInteger, 0) +
+            ber_tlv(tagSequence, bytearray(b''.join(varbinds))))
+        return bytes(ber_tlv(tagSequence, ber_integer(tagInteger, version) +
+            ber_tlv(tagOctetString, bytearray(community)) + pdu))
+
+    def serve_forever(self):
+        self.running = True
+        while self.running:
+            try:
+                data, peer = self.sock.recvfrom(65535)
+            except socket.timeout:
+                continue
+            try:
+                response = self.handle(data)
+            except (IndexError, ValueError):
+                response = None
+            if response is not None:
+                self.sock.sendto(response, peer)
+
+    def start(self):
+        self.thread = threading.Thread(target=self.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        if self.thread is not None:
+            self.thread.join()
+        self.sock.close()
+
+
+def build_store(options):
+    store = MibStore()
+    if options.vs or options.nodes or options.pools:
+        synthesize(store, options.vs, options.nodes, options.pools, options.members)
+    for path in options.snmprec or ():
+        store.load_snmprec(path)
+    return store
+
+
+def add_store_arguments(parser):
+    parser.add_argument('--snmprec', type=str, action='append', help='recorded walk to replay (snmprec format), may be repeated')
+    parser.add_argument('--vs', type=int, help='number of synthesized VirtualServers', default=0)
+    parser.add_argument('--nodes', type=int, help='number of synthesized Nodes', default=0)
+    parser.add_argument('--pools', type=int, help='number of synthesized pools', default=0)
+    parser.add_argument('--members', type=int, help='number of members per synthesized pool', default=5)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='SNMP v2c agent replaying F5 BIG-IP walks')
+    parser.add_argument('-l', '--listen', type=str, help='listening address', default='127.0.0.1')
+    parser.add_argument('-p', '--port', type=int, help='listening UDP port', default=11161)
+    parser.add_argument('-C', '--community', type=str, help='accepted community (any if omitted)', default=None)
+    add_store_arguments(parser)
+    args = parser.parse_args()
+
+    store = build_store(args)
+    agent = ReplayAgent(store, args.listen, args.port, args.community)
+    print("Replaying {} OIDs on {}:{}".format(len(store), *agent.address))
+    try:
+        agent.serve_forever()
+    except KeyboardInterrupt:
+        print("{} PDUs served".format(agent.pdus))
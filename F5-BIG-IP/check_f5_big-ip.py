@@ -7,7 +7,11 @@ F5 Load-Balancer running BIG-IP OS Nagios plugin
 2018-12-12 Eric Belhomme <rico-github@ricozome.net> - added mem_tmm and sessions modes, fixed perfdata
 Published under MIT license
 """
-import argparse, netsnmp
+import argparse, collections, fcntl, fnmatch, hashlib, heapq, json, multiprocessing, netsnmp, os, re, signal, socket, tempfile, time
+try:
+    import configparser
+except ImportError:
+    import ConfigParser as configparser
 
 __author__ = 'Eric Belhomme'
 __contact__ = 'rico-github@ricozome.net'
@@ -21,6 +25,404 @@ retText = [
     'UNKNOWN',
 ]
 
+# characters denoting a regular expression rather than a plain object name
+re_regex_chars = re.compile(r'[\^\$\*\+\?\(\)\[\]\{\}\|\\]')
+
+ltmVsColumns = (
+    ('name',        '.1.3.6.1.4.1.3375.2.2.10.13.2.1.1'),   # Virtual Server name
+    ('status',      '.1.3.6.1.4.1.3375.2.2.10.13.2.1.2'),   # status
+    ('statname',    '.1.3.6.1.4.1.3375.2.2.10.2.3.1.1'),    # Virtual Server name (from another OID)
+    ('cnx_actives', '.1.3.6.1.4.1.3375.2.2.10.2.3.1.12'),   # actives cnx (gauge)
+    ('cnx_max',     '.1.3.6.1.4.1.3375.2.2.10.2.3.1.10'),   # max cnx (gauge)
+    ('cnx_total',   '.1.3.6.1.4.1.3375.2.2.10.2.3.1.11'),   # total cnx (gauge)
+    ('bytes_in',    '.1.3.6.1.4.1.3375.2.2.10.2.3.1.7'),    # bytes in (counter64)
+    ('bytes_out',   '.1.3.6.1.4.1.3375.2.2.10.2.3.1.9'),    # bytes out (counter64)
+)
+
+# VirtualServers count of the configuration and status tables, polled to
+# revalidate the enumvs catalog
+ltmVsNumberScalars = (
+    ('vs_number',   '.1.3.6.1.4.1.3375.2.2.10.1.1.0'),      # ltmVirtualServNumber
+    ('vs_statnum',  '.1.3.6.1.4.1.3375.2.2.10.13.1.0'),     # ltmVsStatusNumber
+)
+
+ltmNodeColumns = (
+    ('name',        '.1.3.6.1.4.1.3375.2.2.4.3.2.1.7'),     # Nom des Nodes (Serveurs Réels)
+    ('status',      '.1.3.6.1.4.1.3375.2.2.4.3.2.1.3'),     # node availability
+    ('cnx_actives', '.1.3.6.1.4.1.3375.2.2.4.2.3.1.9'),     # Connexions actives par Node (Serveur Réel)
+    ('cnx_max',     '.1.3.6.1.4.1.3375.2.2.4.2.3.1.7'),     # Connexions maximales par Node (Serveur Réel)
+    ('cnx_total',   '.1.3.6.1.4.1.3375.2.2.4.2.3.1.8'),     # Connexions totale par Node (Serveur Réel)
+    ('bytes_in',    '.1.3.6.1.4.1.3375.2.2.4.2.3.1.4'),     # Traffic entrant en octets par Node (Serveurs Réels)
+    ('bytes_out',   '.1.3.6.1.4.1.3375.2.2.4.2.3.1.6'),     # Traffic sortant en octets par Node  (Serveurs Réels)
+)
+
+ltmPoolMbrColumns = (
+    ('pool',        '.1.3.6.1.4.1.3375.2.2.5.6.2.1.1'),     # ltmPoolMbrStatusPoolName
+    ('status',      '.1.3.6.1.4.1.3375.2.2.5.6.2.1.5'),     # ltmPoolMbrStatusAvailState
+    ('cnx_actives', '.1.3.6.1.4.1.3375.2.2.5.4.3.1.11'),    # ltmPoolMemberStatServerCurConns
+)
+
+sysHttpScalars = (
+    ('http_req', '.1.3.6.1.4.1.3375.2.1.1.2.1.56.0'),     # sysStatHttpRequests
+)
+
+sysTmmMemScalars = (
+    ('mem_total', '.1.3.6.1.4.1.3375.2.1.1.2.1.44.0'),    # sysStatMemoryTotal
+    ('mem_used',  '.1.3.6.1.4.1.3375.2.1.1.2.1.45.0'),    # sysStatMemoryUsed
+)
+
+sysSessionScalars = (
+    ('cli_cur', '.1.3.6.1.4.1.3375.2.1.1.2.1.8.0'),       # Sessions concurrentes (coté clients)
+    ('srv_cur', '.1.3.6.1.4.1.3375.2.1.1.2.1.15.0'),      # Sessions concurrentes (coté serveurs)
+    ('cli_max', '.1.3.6.1.4.1.3375.2.1.1.2.1.6.0'),       # Nombre Max de Sessions Simultanées (coté client)
+    ('srv_max', '.1.3.6.1.4.1.3375.2.1.1.2.1.13.0'),      # Nombre Max de Sessions Simultanées (coté serveurs)
+    ('cli_tot', '.1.3.6.1.4.1.3375.2.1.1.2.1.7.0'),       # Sessions Totales (coté clients)
+    ('srv_tot', '.1.3.6.1.4.1.3375.2.1.1.2.1.14.0'),      # Sessions Totales (coté serveurs)
+)
+
+sysChassisColumns = (
+    ('psu',  '.1.3.6.1.4.1.3375.2.1.3.2.2.2.1.2'),   # sysChassisPowerSupplyStatus
+    ('temp', '.1.3.6.1.4.1.3375.2.1.3.2.3.2.1.2'),   # sysChassisTempTemperature
+    ('fan',  '.1.3.6.1.4.1.3375.2.1.3.2.1.2.1.2'),   # sysChassisFanStatus
+)
+
+
+def _vb_oid(vb):
+    """
+    Rebuild the full numeric OID of a Varbind returned by netsnmp
+    """
+    oid = vb.tag if vb.tag.startswith('.') else '.' + vb.tag
+    if vb.iid not in (None, ''):
+        oid += '.' + str(vb.iid)
+    return oid
+
+
+def snmp_scalars(scalars):
+    """
+    GET a set of scalars within a single PDU. `scalars` is a sequence of
+    (name, oid) tuples. Returns a dict of {name: int value}, scalars unknown
+    to the agent are left out.
+    """
+    vals = snmpSession.get(netsnmp.VarList(*[netsnmp.Varbind(oid) for name, oid in scalars]))
+    return dict((name, int(val)) for (name, oid), val in zip(scalars, vals or ()) if val is not None)
+
+
+def _walk_table(columns):
+    """
+    Walk table columns with GETBULK requests (`--max-repetitions` rows per
+    column and per PDU) and assemble cells sharing the same OID index suffix
+    into row records.
+
+    `columns` is a sequence of (name, oid) tuples. Returns an OrderedDict
+    mapping each index suffix to a dict of {name: value}. A row lacking a cell
+    in one column simply lacks the corresponding key.
+    """
+    rows = collections.OrderedDict()
+    cursors = [(name, oid, oid) for name, oid in columns]
+    while cursors:
+        varlist = netsnmp.VarList(*[netsnmp.Varbind(cursor) for name, oid, cursor in cursors])
+        snmpSession.getbulk(0, args.max_repetitions, varlist)
+        if not len(varlist):
+            break
+        ended = set()
+        last = {}
+        for pos, vb in enumerate(varlist):
+            col = pos % len(cursors)
+            if col in ended:
+                continue
+            name, prefix, cursor = cursors[col]
+            oid = _vb_oid(vb)
+            if vb.type in ('ENDOFMIBVIEW', 'NOSUCHOBJECT', 'NOSUCHINSTANCE') or not oid.startswith(prefix + '.'):
+                ended.add(col)
+                continue
+            index = oid[len(prefix):]
+            rows.setdefault(index, {})[name] = vb.val
+            last[col] = oid
+        cursors = [
+            (name, prefix, last[col])
+            for col, (name, prefix, cursor) in enumerate(cursors)
+            if col not in ended and last.get(col, cursor) != cursor
+        ]
+    return rows
+
+
+def _cache_path(columns):
+    key = hashlib.sha1(' '.join(oid for name, oid in columns).encode('ascii')).hexdigest()
+    return os.path.join(args.cache_dir, "{}_{}.json".format(args.hostname, key))
+
+
+def _read_cache(path):
+    """
+    Returns the (rows, walk time) stored in cache file `path`, or None if it
+    is missing or older than `--cache-ttl` seconds
+    """
+    try:
+        if time.time() - os.path.getmtime(path) >= args.cache_ttl:
+            return None
+        with open(path) as fd:
+            cache = json.load(fd, object_pairs_hook=collections.OrderedDict)
+        return cache['rows'], cache['walked']
+    except (IOError, OSError, ValueError, KeyError, TypeError):
+        return None
+
+
+def _write_cache(path, rows):
+    # write in a temporary file then rename it, so that readers never see a
+    # partially written cache
+    fd, tmppath = tempfile.mkstemp(dir=args.cache_dir)
+    with os.fdopen(fd, 'w') as tmp:
+        json.dump(rows, tmp)
+    os.rename(tmppath, path)
+
+
+def _make_cache_dir():
+    try:
+        os.makedirs(args.cache_dir)
+    except OSError:
+        if not os.path.isdir(args.cache_dir):
+            raise
+
+
+def get_table(columns):
+    """
+    Returns the rows of table `columns` (see `_walk_table()`), fetched by
+    SNMP or iControl REST according to `--backend`. The time they were
+    fetched at is left in `tableWalked`, for counter rates.
+
+    When `--cache-ttl` is set, rows are cached on disk per host and table,
+    and shared between concurrent plugin invocations: the first one to find
+    the cache missing or stale walks the table while holding an exclusive
+    lock, the others wait for the lock then read its result. Thus N
+    simultaneous checks against the same table cause a single poll.
+    """
+    global tableWalked
+    fetch_table = rest_table if args.backend == 'rest' else _walk_table
+    if not args.cache_ttl:
+        tableWalked = time.time()
+        return fetch_table(columns)
+
+    path = _cache_path(columns)
+    cache = _read_cache(path)
+    if cache is None:
+        _make_cache_dir()
+        with open(path + '.lock', 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            # another invocation may have refreshed the cache while we waited
+            cache = _read_cache(path)
+            if cache is None:
+                walked = time.time()
+                rows = fetch_table(columns)
+                if rows:
+                    _write_cache(path, {'walked': walked, 'rows': rows})
+                cache = rows, walked
+            fcntl.flock(lock, fcntl.LOCK_UN)
+    rows, tableWalked = cache
+    return rows
+
+
+def get_scalars(scalars):
+    """
+    Returns global scalars values (see `snmp_scalars()`), fetched by SNMP or
+    iControl REST according to `--backend`
+    """
+    if args.backend == 'rest':
+        return rest_scalars(scalars)
+    return snmp_scalars(scalars)
+
+
+##### iControl REST backend
+
+restAvailState = {
+    'available': 1,
+    'unavailable': 2,
+    'offline': 3,
+    'unknown': 4,
+    'unlicensed': 5,
+}
+
+restSensorStatus = {
+    'down': '0',
+    'up': '1',
+}
+
+
+def open_rest_session(username, password):
+    """
+    Returns a keep-alive HTTPS session to the iControl REST API
+    """
+    import requests
+    requests.packages.urllib3.disable_warnings(requests.packages.urllib3.exceptions.InsecureRequestWarning)
+    session = requests.Session()
+    session.auth = (username, password)
+    session.verify = False
+    session.headers.update({'Accept': 'application/json'})
+    return session
+
+
+def _rest_get(path):
+    base = args.rest_url or "https://{}".format(args.hostname)
+    response = restSession.get(base.rstrip('/') + '/mgmt/tm/' + path, timeout=args.rest_timeout)
+    response.raise_for_status()
+    return response.json()
+
+
+def _rest_entries(stats):
+    """
+    Yields the statistics entries of each object of a REST stats collection
+    """
+    for item in stats.get('entries', {}).values():
+        yield item.get('nestedStats', {}).get('entries', {})
+
+
+def _rest_value(entries, key):
+    item = entries.get(key, {})
+    return item.get('value', item.get('description'))
+
+
+def _rest_counter(entries, key):
+    # counters missing from the statistics of an object count as 0
+    return int(_rest_value(entries, key) or 0)
+
+
+def _rest_object_row(entries, side):
+    name = _rest_value(entries, 'tmName')
+    return name, {
+        'name': name,
+        'status': str(restAvailState.get(_rest_value(entries, 'status.availabilityState'), 0)),
+        'statname': name,
+        'cnx_actives': str(_rest_counter(entries, side + '.curConns')),
+        'cnx_max': str(_rest_counter(entries, side + '.maxConns')),
+        'cnx_total': str(_rest_counter(entries, side + '.totConns')),
+        'bytes_in': str(_rest_counter(entries, side + '.bitsIn') // 8),
+        'bytes_out': str(_rest_counter(entries, side + '.bitsOut') // 8),
+    }
+
+
+def _rest_objects(path, side):
+    rows = collections.OrderedDict()
+    for entries in _rest_entries(_rest_get(path)):
+        name, row = _rest_object_row(entries, side)
+        rows[_name_to_index(name)] = row
+    return rows
+
+
+def _rest_vs_rows():
+    return _rest_objects('ltm/virtual/stats', 'clientside')
+
+
+def _rest_node_rows():
+    return _rest_objects('ltm/node/stats', 'serverside')
+
+
+def _rest_pool_member_rows():
+    rows = collections.OrderedDict()
+    pools = _rest_get('ltm/pool/stats?expandSubcollections=true')
+    for pool in _rest_entries(pools):
+        for url, members in pool.items():
+            if not url.endswith('/members/stats'):
+                continue
+            for entries in _rest_entries(members.get('nestedStats', {})):
+                poolname = _rest_value(entries, 'poolName')
+                index = _name_to_index(poolname) + _name_to_index(_rest_value(entries, 'nodeName')) + \
+                    ".{}".format(_rest_value(entries, 'port'))
+                rows[index] = {
+                    'pool': poolname,
+                    'status': str(restAvailState.get(_rest_value(entries, 'status.availabilityState'), 0)),
+                    'cnx_actives': str(_rest_counter(entries, 'serverside.curConns')),
+                }
+    return rows
+
+
+def _rest_chassis_rows():
+    rows = collections.OrderedDict()
+    hardware = _rest_get('sys/hardware')
+    for sensor, name, key in (
+            ('chassis-power-supply-status-index', 'psu', 'status'),
+            ('chassis-temperature-status-index', 'temp', 'temperature'),
+            ('chassis-fan-status-index', 'fan', 'status')):
+        for url, table in hardware.get('entries', {}).items():
+            if not url.endswith('/' + sensor):
+                continue
+            for entries in _rest_entries(table.get('nestedStats', {})):
+                value = _rest_value(entries, key)
+                if key == 'status':
+                    # sysChassisPowerSupplyStatus/sysChassisFanStatus codes
+                    value = restSensorStatus.get(value, '2')
+                rows.setdefault(".{}".format(_rest_value(entries, 'index')), {})[name] = str(value)
+    return rows
+
+
+def _rest_http_scalars():
+    requests = 0
+    for entries in _rest_entries(_rest_get('ltm/profile/http/stats')):
+        requests += _rest_counter(entries, 'numberReqs')
+    return {'http_req': requests}
+
+
+def _rest_tmm_memory_scalars():
+    scalars = {'mem_total': 0, 'mem_used': 0}
+    for entries in _rest_entries(_rest_get('sys/tmm-info/stats')):
+        scalars['mem_total'] += _rest_counter(entries, 'memoryTotal')
+        scalars['mem_used'] += _rest_counter(entries, 'memoryUsed')
+    return scalars
+
+
+def _rest_sessions_scalars():
+    scalars = {}
+    for entries in _rest_entries(_rest_get('sys/traffic/stats')):
+        for name, key in (
+                ('cli_cur', 'clientSideTraffic.curConns'),
+                ('srv_cur', 'serverSideTraffic.curConns'),
+                ('cli_max', 'clientSideTraffic.maxConns'),
+                ('srv_max', 'serverSideTraffic.maxConns'),
+                ('cli_tot', 'clientSideTraffic.totConns'),
+                ('srv_tot', 'serverSideTraffic.totConns')):
+            value = _rest_value(entries, key)
+            if value is not None:
+                scalars[name] = int(value)
+    return scalars
+
+
+def _rest_fetchers():
+    """
+    Maps each table column and scalar OID to the REST request returning it
+    """
+    fetchers = {}
+    for columns, fetcher in (
+            (ltmVsColumns, _rest_vs_rows),
+            (ltmNodeColumns, _rest_node_rows),
+            (ltmPoolMbrColumns, _rest_pool_member_rows),
+            (sysChassisColumns, _rest_chassis_rows),
+            (sysHttpScalars, _rest_http_scalars),
+            (sysTmmMemScalars, _rest_tmm_memory_scalars),
+            (sysSessionScalars, _rest_sessions_scalars)):
+        for name, oid in columns:
+            fetchers[oid] = fetcher
+    return fetchers
+
+
+def rest_table(columns):
+    """
+    Same as `_walk_table()`, with the rows built from the iControl REST
+    statistics of the objects
+    """
+    names = [name for name, oid in columns]
+    rows = _rest_fetchers()[columns[0][1]]()
+    for index, row in rows.items():
+        rows[index] = dict((name, value) for name, value in row.items() if name in names)
+    return rows
+
+
+def rest_scalars(scalars):
+    """
+    Same as `snmp_scalars()`, each REST request being issued only once
+    """
+    fetchers = _rest_fetchers()
+    values = {}
+    for fetcher in set(fetchers[oid] for name, oid in scalars):
+        values.update(fetcher())
+    return dict((name, values[name]) for name, oid in scalars if name in values)
+
 
 def print_longHelp():
     print("""
@@ -35,8 +437,36 @@ F5 Load-Balancer running BIG-IP OS Nagios plugin
 * enumvs - enumerates 'VirtualServers' configured on the appliance
 * vsstats - get statistics for a given VirtualServer
 * nodestats - get statistics for remote Nodes (real servers)
+* poolstats - get pools members availability, reporting the worst pools
 * mem_tmm - get TMM meory usage stats (global)
 * sessions - get client and server sessions stats (global)
+* all-globals - health, http, mem_tmm and sessions as passive check results
+* fleet - polls all appliances of an inventory file concurrently
+
+-= backends =-
+--------------
+Data are retrieved by SNMP (v2c, `-C` community) by default. With
+`--backend rest`, they are retrieved from the iControl REST API instead
+(`-U` and `-P` credentials), with one request per statistics collection over
+a keep-alive HTTPS session. Both backends feed the same checks, and all modes
+work with either. `--rest-url` overrides the API base URL (defaults to
+https://<hostname>).
+
+SNMPv3 is selected with `--snmp-version 3`, along with `--sec-name`,
+`--sec-level`, `--auth-proto`, `--auth-pass`, `--priv-proto` and
+`--priv-pass` (and `--context` if needed). The engineID, boots and time of
+each appliance are discovered once, then cached in `--state-dir` for
+`--engine-cache-ttl` seconds (defaults to 86400), so that each check only
+sends its authenticated requests, just as with v2c. The cached engine is
+dropped whenever a request fails, to be discovered again on next run.
+
+-= table cache =-
+-----------------
+Table walks (health, enumvs, vsstats, nodestats...) may be cached on disk, and
+shared between plugin invocations polling the same appliance, by setting
+`--cache-ttl` to the cache lifetime in seconds. Cache files are stored in
+`--cache-dir` (defaults to /var/tmp/check_f5_big-ip), and a lock ensures that
+simultaneous invocations poll the appliance only once.
 
     """)
     print('-= health mode =-\n-----------------\n' + get_health_status.__doc__)
@@ -44,15 +474,18 @@ F5 Load-Balancer running BIG-IP OS Nagios plugin
     print('-= enumvs mode =-\n-----------------\n' + enum_virtualservers.__doc__)
     print('-= vsstats mode =-\n------------------\n' + get_vs_stats.__doc__)
     print('-= nodestats mode =-\n--------------------\n' + get_node_stats.__doc__)
+    print('-= poolstats mode =-\n--------------------\n' + get_pool_stats.__doc__)
     print('-= mem_tmm mode =-\n--------------------\n' + get_mem_tmm.__doc__)
     print('-= sessions mode =-\n--------------------\n' + get_sessions.__doc__)
+    print('-= all-globals mode =-\n----------------------\n' + get_all_globals.__doc__)
+    print('-= fleet mode =-\n----------------\n' + poll_fleet.__doc__)
    
     print("---\nCopyright {author} <{authmail}> under {license} license".format(
         author = __author__, authmail = __contact__, license = __license__))
     exit(0)
 
 
-def get_health_status(perfdata):
+def get_health_status(perfdata, rows=None):
     '''
 Report global system health: PSU health, chassis temperature, and fans health
 
@@ -95,16 +528,18 @@ flags, passed with `--arg1` command-lien parameter:
     flags = ()
     if isinstance(args.arg1,str) and args.arg1 is not None:
         flags = tuple(args.arg1.lower().split(','))
-    oid_status_psu = '.1.3.6.1.4.1.3375.2.1.3.2.2.2.1.2'
     psu = { 'bad': 0, 'good': 0, 'missing': 0}
-    oid_status_temperature = '.1.3.6.1.4.1.3375.2.1.3.2.3.2.1.2'
     temp = { 'ok': 0, 'warn': 0, 'crit': 0 }
-    oid_status_fans = '.1.3.6.1.4.1.3375.2.1.3.2.1.2.1.2'
     fan = { 'bad': 0, 'good': 0, 'missing': 0}
     retcode = 0
 
+    # PSU, temperature and fans sensors are fetched within the same bulk walk
+    if rows is None:
+        rows = get_table(sysChassisColumns)
+    rows = rows.values()
+
     # PSU info
-    vals = snmpSession.walk(netsnmp.VarList(netsnmp.Varbind(oid_status_psu)))
+    vals = [row['psu'] for row in rows if 'psu' in row]
     if vals:
         for item in vals:
             if item == '0':
@@ -115,9 +550,9 @@ flags, passed with `--arg1` command-lien parameter:
                 psu['missing'] += 1
 
         if psu['missing'] > 0:
-            if 'ignoremissingpsu' in args.arg1:
+            if 'ignoremissingpsu' in flags:
                 pass
-            elif 'warnmissingpsu' in args.arg1:
+            elif 'warnmissingpsu' in flags:
                 retcode = 1
                 message.append("{} PSU missing".format(psu['missing']))
             else:
@@ -139,7 +574,7 @@ flags, passed with `--arg1` command-lien parameter:
 
     # Chassis temperature info
     message.append(' - ')
-    vals = snmpSession.walk(netsnmp.VarList(netsnmp.Varbind(oid_status_temperature)))
+    vals = [row['temp'] for row in rows if 'temp' in row]
     if vals:
         ret = 0
         txt = ''
@@ -162,7 +597,7 @@ flags, passed with `--arg1` command-lien parameter:
 
     # Chassis fans info
     message.append(' - ')
-    vals = snmpSession.walk(netsnmp.VarList(netsnmp.Varbind(oid_status_fans)))
+    vals = [row['fan'] for row in rows if 'fan' in row]
     if vals:
         for item in vals:
             if item == '0':
@@ -173,9 +608,9 @@ flags, passed with `--arg1` command-lien parameter:
                 fan['missing'] += 1
         ret = 0
         if fan['missing'] > 0:
-            if 'ignoremissingfan' in args.arg1:
+            if 'ignoremissingfan' in flags:
                 pass
-            elif 'warnmissingfan' in args.arg1:
+            elif 'warnmissingfan' in flags:
                 ret = 1
                 message.append("{} fan missing".format(fan['missing']))
             else:
@@ -203,10 +638,46 @@ flags, passed with `--arg1` command-lien parameter:
     return retcode
 
 
-def _enum_virtualservers():
-    return snmpSession.walk(netsnmp.VarList(
-        netsnmp.Varbind('.1.3.6.1.4.1.3375.2.2.10.13.2.1.1'),
-        netsnmp.Varbind('.1.3.6.1.4.1.3375.2.2.10.2.3.1.1')))
+def get_vs_catalog():
+    """
+    Returns the VirtualServers catalog, as a list of (name, index) tuples
+    sorted by name.
+
+    With the SNMP backend, the catalog is kept on disk per host (in
+    `--cache-dir`) and revalidated by a single GET of the VirtualServers
+    count scalars: the name columns are walked again only when these counts
+    change, or when the catalog is older than `--catalog-ttl` seconds.
+    """
+    if args.backend == 'rest' or not args.catalog_ttl:
+        return _walk_vs_catalog()
+
+    path = os.path.join(args.cache_dir, "{}_catalog.json".format(args.hostname))
+    scalars = snmp_scalars(ltmVsNumberScalars)
+    signature = [scalars.get(name) for name, oid in ltmVsNumberScalars]
+    try:
+        with open(path) as fd:
+            catalog = json.load(fd)
+        if None not in signature and catalog['signature'] == signature \
+                and time.time() - catalog['walked'] < args.catalog_ttl:
+            return [tuple(vs) for vs in catalog['virtualservers']]
+    except (IOError, OSError, ValueError, KeyError):
+        pass
+
+    virtualservers = _walk_vs_catalog()
+    if virtualservers and None not in signature:
+        _make_cache_dir()
+        _write_cache(path, {
+            'signature': signature,
+            'walked': time.time(),
+            'virtualservers': virtualservers,
+        })
+    return virtualservers
+
+
+def _walk_vs_catalog():
+    rows = get_table((ltmVsColumns[0], ltmVsColumns[2]))
+    return sorted((row.get('name', row.get('statname')), index.lstrip('.')) for index, row in rows.items())
+
 
 def enum_virtualservers():
     '''
@@ -215,14 +686,31 @@ Enumerates **VirtualServers** configured on the appliance
 This mode is mainly used to ease Nagios configuration to define how to use
 **vsstats** mode
 
+VirtualServers are listed sorted by name. With `--json`, the plugin only
+prints a JSON document listing their names and SNMP indexes, for
+configuration generation tools:
+
+    {"host": "bigip1", "virtualservers": [{"name": "/Common/www_vs", "index": "14.47.67..."}]}
+
+With the SNMP backend, the list is kept in a catalog file (in `--cache-dir`)
+and revalidated with a single GET of the VirtualServers count: the appliance
+is walked again only when this count changes, or once the catalog is older
+than `--catalog-ttl` seconds (defaults to 3600, 0 disables the catalog).
+
 This mode does not require any additional parameters.
 
     '''
-    vals = _enum_virtualservers()
-    if vals:
+    catalog = get_vs_catalog()
+    if args.json:
+        message.append(json.dumps({
+            'host': args.hostname,
+            'virtualservers': [{'name': name, 'index': index} for name, index in catalog],
+        }))
+        return 0 if catalog else 3
+    if catalog:
         message.append('F5 VirtualServers list: \n')
-        for item in set(vals):
-            message.append("  {}\n".format(item))
+        for name, index in catalog:
+            message.append("  {}\n".format(name))
     else:
         message.append('Unable to retrieve VirtualServer informations')
         return 3
@@ -246,15 +734,16 @@ def _check_avail(status, strType, strObject):
         message.append("{} {} status {} ({})\n".format(strType, strObject, ltmVsStatusAvailState[status][0], ltmVsStatusAvailState[status][1]))
         if status == 4:
             retcode = 3
-        elif status == 1 or status == 5:
+        elif status == 2 or status == 5:
             retcode = 1
         elif status == 0 or status == 3:
             retcode = 2
     return retcode
 
 
-def _get_stats(cnx_actives, cnx_max, cnx_total, bytes_in, bytes_out, warn, crit):
+def _get_stats(cnx_actives, cnx_max, cnx_total, bytes_in, bytes_out, warn, crit, rates=None):
     retcode, ret = 0, 0
+    warn, crit = tuple(map(int, warn)), tuple(map(int, crit))
     # check actives connections
     cnx_actives = int(cnx_actives)
     if cnx_actives > warn[0]:
@@ -278,22 +767,250 @@ def _get_stats(cnx_actives, cnx_max, cnx_total, bytes_in, bytes_out, warn, crit)
         retcode = ret
     if args.perfdata:
         perfmsg.append("'cnx_total'={};{};{}".format(str(cnx_total), str(warn[2]), str(crit[2])))
-    message.append( " - bytes in: {}, bytes out: {}\n".format(bytes_in, bytes_out))
+    message.append( " - bytes in: {}, bytes out: {}".format(bytes_in, bytes_out))
     if args.perfdata:
-        perfmsg.append("'bytes_in'=".format(bytes_in))
-        perfmsg.append("'bytes_out'=".format(bytes_out))
+        perfmsg.append("'bytes_in'={}c".format(bytes_in))
+        perfmsg.append("'bytes_out'={}c".format(bytes_out))
+    # check throughput and new connections rates (optional 4th and 5th triggers)
+    if rates is not None:
+        bps_in, bps_out, cps = rates
+        ret = 0
+        if len(warn) > 3 and max(bps_in, bps_out) > warn[3]:
+            ret = 1
+        if len(crit) > 3 and max(bps_in, bps_out) > crit[3]:
+            ret = 2
+        if len(warn) > 4 and cps > warn[4]:
+            ret = max(ret, 1)
+        if len(crit) > 4 and cps > crit[4]:
+            ret = 2
+        if ret > retcode:
+            retcode = ret
+        message.append(" - {} B/s in, {} B/s out, {} new cnx/s".format(int(bps_in), int(bps_out), round(cps, 2)))
+        if args.perfdata:
+            wb, cb = (warn[3] if len(warn) > 3 else ''), (crit[3] if len(crit) > 3 else '')
+            perfmsg.append("'in_rate'={};{};{};0".format(int(bps_in), wb, cb))
+            perfmsg.append("'out_rate'={};{};{};0".format(int(bps_out), wb, cb))
+            perfmsg.append("'cnx_rate'={};{};{};0".format(round(cps, 2), (warn[4] if len(warn) > 4 else ''), (crit[4] if len(crit) > 4 else '')))
+    message.append("\n")
     return retcode
+
+
+def _counter_delta(previous, current):
+    """
+    Returns the increase of a Counter64 between two samples, handling
+    wrap-around. Returns None when the counter went backwards because of a
+    reboot or a statistics reset.
+    """
+    if current >= previous:
+        return current - previous
+    # a wrapped counter was close to its maximum on the previous sample
+    if previous > 2**63:
+        return current + 2**64 - previous
+    return None
+
+
+def counter_rates(kind, selected):
+    """
+    Computes per-second rates of bytes in, bytes out and total connections
+    counters for the `selected` (name, row) objects, against the samples
+    stored on previous run in the per-host state file of `--state-dir`, then
+    stores current samples in place of them. Samples are timed when their
+    table was fetched, which may be earlier than now when it was cached.
+
+    Returns a dict of {name: (bytes in/s, bytes out/s, new connections/s)}
+    for objects having a usable previous sample.
+    """
+    rates = {}
+    if not selected:
+        return rates
+    now = tableWalked if tableWalked is not None else time.time()
+    path = os.path.join(args.state_dir, "{}.state".format(args.hostname))
+    try:
+        if not os.path.isdir(args.state_dir):
+            os.makedirs(args.state_dir)
+        with open(path, 'a+') as fd:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            fd.seek(0)
+            try:
+                state = json.load(fd)
+            except ValueError:
+                state = {}
+            for name, row in selected:
+                key = "{}:{}".format(kind, name)
+                counters = [int(row['bytes_in']), int(row['bytes_out']), int(row['cnx_total'])]
+                previous = state.get(key)
+                if previous is not None:
+                    elapsed = now - previous[0]
+                    if elapsed < 1:
+                        continue
+                    deltas = [_counter_delta(p, c) for p, c in zip(previous[1:], counters)]
+                    if None not in deltas:
+                        rates[name] = tuple(float(d) / elapsed for d in deltas)
+                state[key] = [round(now, 1)] + counters
+            # forget objects that have not been polled for a day
+            for key in [key for key, sample in state.items() if now - sample[0] > 86400]:
+                del state[key]
+            fd.seek(0)
+            fd.truncate()
+            json.dump(state, fd, separators=(',', ':'))
+            fcntl.flock(fd, fcntl.LOCK_UN)
+    except (IOError, OSError):
+        message.append("Unable to store counters state in {}\n".format(path))
+    return rates
     
 
+def load_thresholds(path):
+    """
+    Compiles the per-object triggers file `path` into a lookup index: a dict
+    of exact names, and the list of (regex, triggers) of glob and regex
+    patterns, in file order. Returns (exact, patterns).
+    """
+    exact = {}
+    patterns = []
+    with open(path) as fd:
+        for lineno, line in enumerate(fd, 1):
+            fields = line.split('#', 1)[0].split()
+            if not fields:
+                continue
+            if len(fields) != 3:
+                raise ValueError("{}:{}: expected '<name> <warning> <critical>'".format(path, lineno))
+            name, warning, critical = fields
+            triggers = (tuple(warning.split(',')), tuple(critical.split(',')))
+            if name.startswith('re:'):
+                # each pattern is compiled alone, so that its flags and groups
+                # don't leak to the other patterns
+                try:
+                    patterns.append((re.compile(name[3:]), triggers))
+                except re.error as e:
+                    raise ValueError("{}:{}: invalid regular expression '{}': {}".format(path, lineno, name[3:], e))
+            elif re.search(r'[\*\?\[]', name):
+                patterns.append((re.compile(fnmatch.translate(name)), triggers))
+            else:
+                exact.setdefault(name, triggers)
+    return exact, patterns
+
+
+def match_thresholds(thresholds, name):
+    """
+    Returns the (warning, critical) triggers of object `name`, or None when
+    no entry of the thresholds index matches it
+    """
+    exact, patterns = thresholds
+    if name in exact:
+        return exact[name]
+    for regex, triggers in patterns:
+        if regex.match(name):
+            return triggers
+    return None
+
+
+def _check_objects(kind, strType, selected, warn, crit):
+    """
+    Checks the availability and statistics of the `selected` (name, row)
+    VirtualServers or Nodes.
+
+    When `--thresholds` is set, every object is checked against its own
+    triggers, and only a summary is reported: count of objects per state and
+    the `--top` worst objects details.
+    """
+    if not selected:
+        message.append("No {} found\n".format(strType))
+        return 3
+    retcode = 0
+    rates = counter_rates(kind, selected)
+    thresholds = None
+    if args.thresholds:
+        try:
+            thresholds = load_thresholds(args.thresholds)
+        except (IOError, ValueError) as e:
+            message.append("Unable to load thresholds: {}\n".format(e))
+            return 3
+    states = [0, 0, 0, 0]
+    offenders = []
+    for name, row in selected:
+        objwarn, objcrit = warn, crit
+        if thresholds is not None:
+            triggers = match_thresholds(thresholds, name)
+            if triggers is not None:
+                objwarn, objcrit = triggers
+        mark, perfmark = len(message), len(perfmsg)
+        # check status
+        ret = _check_avail(int(row['status']), strType, name)
+        ret2 = _get_stats(row['cnx_actives'], row['cnx_max'], row['cnx_total'], row['bytes_in'], row['bytes_out'], objwarn, objcrit, rates.get(name))
+        if ret2 < 3 and ret2 > ret:
+            ret = ret2
+        if ret > retcode:
+            retcode = ret
+        if thresholds is not None:
+            states[ret] += 1
+            if ret:
+                # worst states first (CRITICAL, UNKNOWN, WARNING), then busiest
+                offenders.append(((0, 1, 3, 2)[ret], int(row['cnx_actives']), name, "".join(message[mark:])))
+            del message[mark:]
+            del perfmsg[perfmark:]
+
+    if thresholds is not None:
+        message.append("{} {}s: {}\n".format(len(selected), strType,
+            ", ".join("{} {}".format(count, retText[state]) for state, count in enumerate(states) if count)))
+        top = heapq.nlargest(args.top, offenders)
+        if top:
+            message.append("top {} offenders:\n".format(len(top)))
+            for severity, cnx_actives, name, detail in top:
+                message.append(detail)
+        if args.perfdata:
+            perfmsg.append("'ok'={} 'warning'={} 'critical'={} 'unknown'={}".format(*states))
+    return retcode
+
+
+def _name_to_index(name):
+    """
+    BIG-IP tables keyed by an object name are indexed by the length-prefixed
+    ASCII codes of that name, eg. '/Common/vs' -> '.10.47.67.111...'
+    """
+    return '.{}.{}'.format(len(name), '.'.join(str(ord(c)) for c in name))
+
+
+def _get_vs_row(vsname):
+    """
+    Fetch the row of a single VirtualServer with one GET PDU. Returns None if
+    the VirtualServer does not exist on the appliance
+    """
+    global tableWalked
+    index = _name_to_index(vsname)
+    tableWalked = time.time()
+    if args.backend == 'rest':
+        try:
+            # '/Common/my_vs' is addressed as '~Common~my_vs'
+            stats = _rest_get("ltm/virtual/{}/stats".format(vsname.replace('/', '~')))
+        except Exception:
+            return None
+        for entries in _rest_entries(stats):
+            name, row = _rest_object_row(entries, 'clientside')
+            return collections.OrderedDict([(index, row)])
+        return None
+    vals = snmpSession.get(netsnmp.VarList(*[netsnmp.Varbind(oid + index) for name, oid in ltmVsColumns]))
+    if not vals or None in vals:
+        return None
+    return collections.OrderedDict([(index, dict(zip([name for name, oid in ltmVsColumns], vals)))])
+
+
 def get_vs_stats(vsfilter, perfdata=False):
     '''
 Get statistics for a given VirtualServer, the target VS is passed as `--arg1`
 parameter.
 
+When `--arg1` is a plain VirtualServer name (eg. `/Common/my_vs`), its row is
+fetched with a single SNMP GET, and the check is UNKNOWN if it does not
+exist. When it is a regular expression (eg. `/Common/web_.*$`), the whole
+VirtualServer table is walked and filtered against it. If the table
+cache is enabled (`--cache-ttl`), the cached VirtualServer table is used
+instead of the single GET, so that all vsstats checks of an appliance share
+the same walk.
+
 The check returns the following informations:
 * VirtualServer name and status,
 * connections details (current, max, total)
-* bandwidth usage (incoming bytes, outgoing bytes)
+* bandwidth usage (incoming bytes, outgoing bytes, and their rates)
 
 Warning and critical triggers (respectively `-w` and `-c` command-line
 parameters) are passed as 3 comma-separated values for respectively
@@ -304,14 +1021,33 @@ If ommited, defaults to :
     -w 200000,200000,200000
     -c 250000,250000,250000
 
+Bytes and total connections counters are sampled on each run in a per-host
+state file (in `--state-dir`), which gives incoming and outgoing throughput
+(bytes/s) and new connections rate (connections/s) from the second run on.
+Counter wrap-around is handled, and samples following a reboot or a
+statistics reset are skipped. Rates may be checked by adding a 4th
+(bytes/s, in or out) and 5th (new connections/s) value to the triggers:
+
+    -w 200000,200000,200000,100000000,5000
+
+Instead of `-w` and `-c`, each object may be given its own triggers with a
+thresholds file (`--thresholds`), all objects being then checked within a
+single table walk. Each line holds an object name, or a glob pattern, or a
+regular expression prefixed with `re:`, followed by warning and critical
+triggers. Exact names take precedence, then patterns are tried in file order;
+objects matching no line fall back to `-w` and `-c`:
+
+    /Common/www_vs          1000,1000,100000   2000,2000,200000
+    /Common/api_*           500,500,50000      800,800,80000
+    re:^/Common/db_[0-9]+$  100,100,10000      200,200,20000
+
+With a thresholds file, the output only summarizes how many objects are in
+each state, and details the `--top` (defaults to 5) worst objects.
+
 Additionally, if `--perfdata` command-line argument is triggered, Nagios
 perfdata are computed and appended to the output.
 
     '''
-    regex = None
-    if vsfilter is not None:
-        regex = re.compile(vsfilter)
-
     warn = ('200000','200000','200000')
     if isinstance(args.warning,str) and args.warning is not None:
         warn = tuple(args.warning.split(','))
@@ -319,30 +1055,46 @@ perfdata are computed and appended to the output.
     if isinstance(args.critical,str) and args.critical is not None:
         crit = tuple(args.critical.split(','))
     retcode = 0
-    
-    vals = snmpSession.walk( netsnmp.VarList(
-        netsnmp.Varbind('.1.3.6.1.4.1.3375.2.2.10.13.2.1.1'),   # Virtual Server name
-        netsnmp.Varbind('.1.3.6.1.4.1.3375.2.2.10.13.2.1.2'),   # status
-        netsnmp.Varbind('.1.3.6.1.4.1.3375.2.2.10.2.3.1.1'),    # Virtual Server name (from another OID)
-        netsnmp.Varbind('.1.3.6.1.4.1.3375.2.2.10.2.3.1.12'),   # actives cnx (gauge)
-        netsnmp.Varbind('.1.3.6.1.4.1.3375.2.2.10.2.3.1.10'),   # max cnx (gauge)
-        netsnmp.Varbind('.1.3.6.1.4.1.3375.2.2.10.2.3.1.11'),   # total cnx (gauge)
-        netsnmp.Varbind('.1.3.6.1.4.1.3375.2.2.10.2.3.1.7'),    # bytes in (counter64)
-        netsnmp.Varbind('.1.3.6.1.4.1.3375.2.2.10.2.3.1.9')))   # bytes out (counter64)
-    if vals:
-        for name1, status, name2, cnx_actives, cnx_max, cnx_total, bytes_in, bytes_out in tuple( vals[i:i+8] for i in range(0, len(vals), 8)):
+
+    rows = None
+    table = None
+    regex = None
+    if vsfilter is not None:
+        if re_regex_chars.search(vsfilter) is None:
+            if args.cache_ttl:
+                # the cached table is shared with other VirtualServer checks
+                table = get_table(ltmVsColumns)
+                index = _name_to_index(vsfilter)
+                if index in table:
+                    rows = collections.OrderedDict([(index, table[index])])
+            else:
+                rows = _get_vs_row(vsfilter)
+            if rows is None:
+                message.append("VirtualServer {} not found\n".format(vsfilter))
+                return 3
+        else:
+            regex = re.compile(vsfilter)
+    if rows is None:
+        rows = table if table is not None else get_table(ltmVsColumns)
+    if rows:
+        selected = []
+        for row in rows.values():
+            name1 = row.get('name', row.get('statname'))
             if regex is not None:
-                if re.match(regex, name1) != None:
+                if name1 is None or re.match(regex, name1) is None:
                     continue
+            if len(row) != len(ltmVsColumns):
+                message.append("Incomplete SNMP data for VirtualServer {}\n".format(name1))
+                retcode = 3
+                continue
             # VS name match
-            if name1 != name2:
-                message.append("VirtualServer OID names mismatch: {} != {}".format(name1, name2))
+            if row['name'] != row['statname']:
+                message.append("VirtualServer OID names mismatch: {} != {}\n".format(row['name'], row['statname']))
                 retcode = 3
-            # check status
-            retcode = _check_avail(int(status), 'VirtualServer', name1)
-            ret = _get_stats(cnx_actives, cnx_max, cnx_total, bytes_in, bytes_out, warn, crit)
-            if ret < 3 and ret > retcode:
-                retcode = ret
+            selected.append((name1, row))
+        ret = _check_objects('vs', 'VirtualServer', selected, warn, crit)
+        if ret > retcode:
+            retcode = ret
     else:
         retcode = 3
         message.append('Failed to retrieve VirtualServer data')
@@ -357,7 +1109,7 @@ Get statistics for Nodes, the 'real' servers behind the Load Balancer.
 The check returns for each node found the following informations:
 * Node name and status,
 * connections details (current, max, total)
-* bandwidth usage (incoming bytes, outgoing bytes)
+* bandwidth usage (incoming bytes, outgoing bytes, and their rates)
 
 Warning and critical triggers (respectively `-w` and `-c` command-line
 parameters) are passed as 3 comma-separated values for respectively
@@ -368,6 +1120,29 @@ If ommited, defaults to :
     -w 200000,200000,200000
     -c 250000,250000,250000
 
+Bytes and total connections counters are sampled on each run in a per-host
+state file (in `--state-dir`), which gives incoming and outgoing throughput
+(bytes/s) and new connections rate (connections/s) from the second run on.
+Counter wrap-around is handled, and samples following a reboot or a
+statistics reset are skipped. Rates may be checked by adding a 4th
+(bytes/s, in or out) and 5th (new connections/s) value to the triggers:
+
+    -w 200000,200000,200000,100000000,5000
+
+Instead of `-w` and `-c`, each object may be given its own triggers with a
+thresholds file (`--thresholds`), all objects being then checked within a
+single table walk. Each line holds an object name, or a glob pattern, or a
+regular expression prefixed with `re:`, followed by warning and critical
+triggers. Exact names take precedence, then patterns are tried in file order;
+objects matching no line fall back to `-w` and `-c`:
+
+    /Common/www_vs          1000,1000,100000   2000,2000,200000
+    /Common/api_*           500,500,50000      800,800,80000
+    re:^/Common/db_[0-9]+$  100,100,10000      200,200,20000
+
+With a thresholds file, the output only summarizes how many objects are in
+each state, and details the `--top` (defaults to 5) worst objects.
+
 Additionally, if `--perfdata` command-line argument is triggered, Nagios
 perfdata are computed and appended to the output.
 
@@ -379,30 +1154,118 @@ perfdata are computed and appended to the output.
     if isinstance(args.critical,str) and args.critical is not None:
         crit = tuple(args.critical.split(','))
 
-    vals = snmpSession.walk( netsnmp.VarList(
-        netsnmp.Varbind('.1.3.6.1.4.1.3375.2.2.5.6.2.1.9'),     # Nom des Nodes (Serveurs Réels)
-        netsnmp.Varbind('.1.3.6.1.4.1.3375.2.2.5.6.2.1.5'),     # node availability
-        netsnmp.Varbind('.1.3.6.1.4.1.3375.2.2.4.2.3.1.9'),     # Connexions actives par Node (Serveur Réel)
-        netsnmp.Varbind('.1.3.6.1.4.1.3375.2.2.4.2.3.1.7'),     # Connexions maximales par Node (Serveur Réel)
-        netsnmp.Varbind('.1.3.6.1.4.1.3375.2.2.4.2.3.1.8'),     # Connexions totale par Node (Serveur Réel)
-        netsnmp.Varbind('.1.3.6.1.4.1.3375.2.2.4.2.3.1.4'),     # Traffic entrant en octets par Node (Serveurs Réels)
-        netsnmp.Varbind('.1.3.6.1.4.1.3375.2.2.4.2.3.1.6'),     # Traffic sortant en octets par Node  (Serveurs Réels)
-    ))
-    if vals:
-        for name, status, cnx_actives, cnx_max, cnx_total, bytes_in, bytes_out in tuple( vals[i:i+7] for i in range(0, len(vals), 7)):
-            # check status
-            retcode = _check_avail(int(status), 'Node', name)
-            ret = _get_stats(cnx_actives, cnx_max, cnx_total, bytes_in, bytes_out, warn, crit)
-            if ret < 3 and ret > retcode:
-                retcode = ret
+    retcode = 0
+
+    rows = get_table(ltmNodeColumns)
+    if rows:
+        selected = []
+        for index, row in rows.items():
+            name = row.get('name', index)
+            if len(row) != len(ltmNodeColumns):
+                message.append("Incomplete SNMP data for Node {}\n".format(name))
+                retcode = 3
+                continue
+            selected.append((name, row))
+        ret = _check_objects('node', 'Node', selected, warn, crit)
+        if ret > retcode:
+            retcode = ret
     else:
         retcode = 3
-        message.append('Failed to retrieve VirtualServer data')
+        message.append('Failed to retrieve Node data')
     
     return retcode
 
 
-def get_http_stats(perfdata):
+def get_pool_stats(perfdata=False):
+    '''
+Get members availability of pools, aggregated per pool: members up, members
+down, and active connections.
+
+Pool members status and statistics tables are bulk walked once, then only the
+`--top` (defaults to 5) worst pools having down members are detailed in the
+output, so that its size stays bounded whatever the number of pools and
+members. Pools may be filtered with a regular expression passed as `--arg1`
+parameter.
+
+Warning and critical triggers (respectively `-w` and `-c` command-line
+parameters) are the percentage of down members in a pool.
+
+If ommited, defaults to :
+
+    -w 50
+    -c 100
+
+Additionally, if `--perfdata` command-line argument is triggered, Nagios
+perfdata are computed and appended to the output: count of pools per state,
+count of members up and down, and total of active connections.
+
+    '''
+    warn = 50
+    if isinstance(args.warning,str) and args.warning is not None:
+        warn = int(args.warning)
+    crit = 100
+    if isinstance(args.critical,str) and args.critical is not None:
+        crit = int(args.critical)
+    regex = None
+    if args.arg1 is not None:
+        regex = re.compile(args.arg1)
+
+    rows = get_table(ltmPoolMbrColumns)
+    if not rows:
+        message.append('Failed to retrieve pool members data')
+        return 3
+
+    # pool name -> [members, up, down, active connections]
+    pools = {}
+    for row in rows.values():
+        if 'pool' not in row or 'status' not in row:
+            continue
+        if regex is not None and re.match(regex, row['pool']) is None:
+            continue
+        pool = pools.setdefault(row['pool'], [0, 0, 0, 0])
+        pool[0] += 1
+        status = int(row['status'])
+        # green members are up, none/yellow/red ones are down, and blue
+        # (unmonitored) or gray ones are neither
+        if status == 1:
+            pool[1] += 1
+        elif status in (0, 2, 3):
+            pool[2] += 1
+        pool[3] += int(row.get('cnx_actives', 0))
+
+    retcode = 0
+    states = [0, 0, 0, 0]
+    ranked = []
+    for name, (members, up, down, cnx_actives) in pools.items():
+        ratio = (down * 100.0) / members
+        ret = 0
+        if ratio >= warn:
+            ret = 1
+        if ratio >= crit:
+            ret = 2
+        states[ret] += 1
+        if ret > retcode:
+            retcode = ret
+        if down:
+            ranked.append((ret, ratio, cnx_actives, name, members, up, down))
+
+    message.append("{} pools ({} members): {}\n".format(len(pools), sum(pool[0] for pool in pools.values()),
+        ", ".join("{} {}".format(count, retText[state]) for state, count in enumerate(states) if count)))
+    top = heapq.nlargest(args.top, ranked)
+    if top:
+        message.append("top {} worst pools:\n".format(len(top)))
+        for ret, ratio, cnx_actives, name, members, up, down in top:
+            message.append("pool {} {}: {}/{} members up, {} down, {} actives connections\n".format(
+                name, retText[ret], up, members, down, cnx_actives))
+    if perfdata:
+        perfmsg.append("'pools_ok'={} 'pools_warning'={} 'pools_critical'={}".format(*states[:3]))
+        perfmsg.append("'members_up'={} 'members_down'={} 'cnx_actv'={}".format(
+            sum(pool[1] for pool in pools.values()), sum(pool[2] for pool in pools.values()),
+            sum(pool[3] for pool in pools.values())))
+    return retcode
+
+
+def get_http_stats(perfdata, scalars=None):
     '''
 Reports global HTTP requests
 
@@ -420,16 +1283,17 @@ No additional arguments are required
 
     '''
     retcode = 0
-    warn = '200000'
+    warn = 200000
     if isinstance(args.warning,str) and args.warning is not None:
         warn = int(args.warning)
-    crit = '250000'
+    crit = 250000
     if isinstance(args.critical,str) and args.critical is not None:
         crit = int(args.critical)
 
-    vals = map( int, snmpSession.get(netsnmp.VarList(netsnmp.Varbind('.1.3.6.1.4.1.3375.2.1.1.2.1.56.0'))))
-    if len(vals):
-        val = vals[0]
+    if scalars is None:
+        scalars = get_scalars(sysHttpScalars)
+    if 'http_req' in scalars:
+        val = scalars['http_req']
         if val > warn:
             retcode = 1
         if val > crit:
@@ -444,7 +1308,7 @@ No additional arguments are required
     return retcode
 
 
-def get_mem_tmm(perfdata):
+def get_mem_tmm(perfdata, scalars=None):
     '''
 Reports consumed memory by TMM processes
 
@@ -471,12 +1335,10 @@ No additional arguments are required
     if isinstance(args.critical,str) and args.critical is not None:
         crit = int(args.critical)
 
-    vals = map( int, snmpSession.get(netsnmp.VarList(netsnmp.Varbind('.1.3.6.1.4.1.3375.2.1.1.2.1.44.0'))))
-    if len(vals):
-        memtot = vals[0]
-    vals = map( int, snmpSession.get(netsnmp.VarList(netsnmp.Varbind('.1.3.6.1.4.1.3375.2.1.1.2.1.45.0'))))
-    if len(vals):
-        memused = vals[0]
+    if scalars is None:
+        scalars = get_scalars(sysTmmMemScalars)
+    memtot = scalars.get('mem_total', 0)
+    memused = scalars.get('mem_used', 0)
 
     if memtot and memused:
         retcode = 0
@@ -497,7 +1359,7 @@ No additional arguments are required
     return retcode
 
 
-def get_sessions(perfdata):
+def get_sessions(perfdata, scalars=None):
     '''
 Reports clients & servers sessions
 
@@ -524,15 +1386,10 @@ No additional arguments are required
     if isinstance(args.critical,str) and args.critical is not None:
         crit = tuple(args.critical.split(','))
 
-    (cliCurSess, serCurSess, cliMaxSess, serMaxSess, cliTotSess, serTotSess) = map(int,
-        snmpSession.get(netsnmp.VarList(
-        netsnmp.Varbind('.1.3.6.1.4.1.3375.2.1.1.2.1.8.0'),
-        netsnmp.Varbind('.1.3.6.1.4.1.3375.2.1.1.2.1.15.0'),
-        netsnmp.Varbind('.1.3.6.1.4.1.3375.2.1.1.2.1.6.0'),
-        netsnmp.Varbind('.1.3.6.1.4.1.3375.2.1.1.2.1.13.0'),
-        netsnmp.Varbind('.1.3.6.1.4.1.3375.2.1.1.2.1.7.0'),
-        netsnmp.Varbind('.1.3.6.1.4.1.3375.2.1.1.2.1.14.0')
-        )))
+    if scalars is None:
+        scalars = get_scalars(sysSessionScalars)
+    (cliCurSess, serCurSess, cliMaxSess, serMaxSess, cliTotSess, serTotSess) = [
+        scalars.get(name, 0) for name, oid in sysSessionScalars]
 
     if cliTotSess and serTotSess:
         retcode = 0
@@ -547,6 +1404,8 @@ No additional arguments are required
         message.append( "client sessions: {} (max: {}) / {}".format(str(cliCurSess), str(cliMaxSess), str(cliTotSess)))
         message.append( " - ")
         message.append( "server sessions: {} (max: {}) / {}".format(str(serCurSess), str(serMaxSess), str(serTotSess)))
+    else:
+        message.append('Failed to retrieve sessions data')
 
     if perfdata:
         perfmsg.append("'cli_sess'={};{};{};0;{}".format(str(cliCurSess), str(warn[0]), str(crit[0]), str(cliTotSess)))
@@ -554,11 +1413,456 @@ No additional arguments are required
     return retcode
 
 
+def _passive_result(host, service, retcode, text, perf):
+    """
+    Format a check result as a Nagios PROCESS_SERVICE_CHECK_RESULT external
+    command. Multi-lines outputs are escaped as Nagios expects them.
+    """
+    output = text.strip().replace('\\', '\\\\').replace('\n', '\\n')
+    if perf:
+        output += '|' + perf
+    return "[{}] PROCESS_SERVICE_CHECK_RESULT;{};{};{};{}".format(
+        int(time.time()), host, service, retcode, output)
+
+
+def submit_passive(results):
+    """
+    Write passive check results to the Nagios command file given with
+    `--cmdfile`, or print them on stdout when it is not set
+    """
+    if args.cmdfile is None:
+        for line in results:
+            print(line)
+        return
+    # one write per command so that lines are not interleaved with other
+    # writers of the Nagios command pipe
+    fd = os.open(args.cmdfile, os.O_WRONLY | os.O_APPEND)
+    try:
+        for line in results:
+            os.write(fd, (line + '\n').encode('utf-8'))
+    finally:
+        os.close(fd)
+
+
+def get_all_globals(perfdata):
+    '''
+Reports health, http, mem_tmm and sessions checks at once, as passive check
+results.
+
+All global scalars are fetched within a single SNMP GET, and all chassis
+sensor tables within a single bulk walk, then each sub-check is evaluated as
+its own mode would do, with its default triggers (`-w` and `-c` are ignored).
+
+Results are formatted as Nagios `PROCESS_SERVICE_CHECK_RESULT` external
+commands, for the host given by `--passive-host` (defaults to `-H` value) and
+services named after each sub-check, prefixed by `--service-prefix`:
+
+    [1544612400] PROCESS_SERVICE_CHECK_RESULT;bigip1;F5 mem_tmm;0;TMM memory: ...
+
+They are printed on stdout, or written to the Nagios command file when
+`--cmdfile` is set (eg. `--cmdfile /var/spool/nagios/cmd/nagios.cmd`). In
+this latter case, the plugin output summarizes the sub-checks states and its
+exit code is the worst of them.
+
+`--health-flags` passes the `--arg1` flags of the **health** sub-check.
+
+    '''
+    # -w/-c triggers have a different meaning for each sub-check
+    args.warning, args.critical = None, None
+    args.arg1 = args.health_flags
+
+    scalars = get_scalars(sysHttpScalars + sysTmmMemScalars + sysSessionScalars)
+    chassis = get_table(sysChassisColumns)
+
+    host = args.passive_host or args.hostname
+    retcode = 0
+    results = []
+    states = []
+    for service, check, data in (
+            ('health', get_health_status, chassis),
+            ('http', get_http_stats, scalars),
+            ('mem_tmm', get_mem_tmm, scalars),
+            ('sessions', get_sessions, scalars)):
+        del message[:]
+        del perfmsg[:]
+        ret = check(perfdata, data)
+        results.append(_passive_result(host, args.service_prefix + service, ret, "".join(message), " ".join(perfmsg)))
+        states.append("{} {}".format(service, retText[ret]))
+        if ret > retcode:
+            retcode = ret
+
+    del message[:]
+    del perfmsg[:]
+    passive.extend(results)
+    message.append("{} passive results: {}".format(len(results), ", ".join(states)))
+    return retcode
+
+
+##### SNMPv3 engine discovery
+
+def _ber(tag, value):
+    length = len(value)
+    if length < 0x80:
+        return bytearray([tag, length]) + value
+    size = bytearray()
+    while length:
+        size.insert(0, length & 0xff)
+        length >>= 8
+    return bytearray([tag, 0x80 | len(size)]) + size + value
+
+
+def _ber_int(value):
+    out = bytearray([value & 0xff])
+    value >>= 8
+    while value:
+        out.insert(0, value & 0xff)
+        value >>= 8
+    if out[0] & 0x80:
+        out.insert(0, 0)
+    return _ber(0x02, out)
+
+
+def _ber_items(data, start, end):
+    """
+    Yields the (tag, value start, value end) of the TLVs of `data` between
+    `start` and `end`
+    """
+    while start < end:
+        tag, length = data[start], data[start + 1]
+        start += 2
+        if length & 0x80:
+            count = length & 0x7f
+            length = 0
+            for byte in data[start:start + count]:
+                length = (length << 8) | byte
+            start += count
+        yield tag, start, start + length
+        start += length
+
+
+def _ber_to_int(data, start, end):
+    value = 0
+    for byte in data[start:end]:
+        value = (value << 8) | byte
+    return value
+
+
+def _discover_engine(hostname):
+    """
+    Sends a SNMPv3 discovery probe (unauthenticated GET with an empty
+    engineID, see RFC 3414) to `hostname`, and returns the (engineID as hex
+    string, boots, time) of the authoritative engine from its report, or None
+    """
+    host, port = hostname, 161
+    if host.startswith('udp:'):
+        host = host[4:]
+    if host.count(':') == 1:
+        host, port = host.split(':')
+    msgid = os.getpid() & 0x7fffffff
+    empty = bytearray()
+    usm = _ber(0x30, _ber(0x04, empty) + _ber_int(0) + _ber_int(0) + _ber(0x04, empty) * 3)
+    pdu = _ber(0xa0, _ber_int(msgid) + _ber_int(0) + _ber_int(0) + _ber(0x30, empty))
+    probe = bytes(_ber(0x30, _ber_int(3) +
+        _ber(0x30, _ber_int(msgid) + _ber_int(65507) + _ber(0x04, bytearray([0x04])) + _ber_int(3)) +
+        _ber(0x04, usm) + _ber(0x30, _ber(0x04, empty) + _ber(0x04, empty) + pdu)))
+
+    family, socktype, proto, canonname, address = socket.getaddrinfo(host, int(port), 0, socket.SOCK_DGRAM)[0]
+    sock = socket.socket(family, socktype)
+    sock.settimeout(args.snmp_timeout)
+    try:
+        for attempt in range(args.snmp_retries + 1):
+            sock.sendto(probe, address)
+            try:
+                data = bytearray(sock.recv(65535))
+            except socket.timeout:
+                continue
+            try:
+                tag, start, end = next(_ber_items(data, 0, len(data)))
+                fields = list(_ber_items(data, start, end))
+                tag, start, end = next(_ber_items(data, fields[2][1], fields[2][2]))
+                engine_id, boots, enginetime = list(_ber_items(data, start, end))[:3]
+            except (StopIteration, IndexError, ValueError):
+                continue
+            return (''.join('{:02x}'.format(byte) for byte in data[engine_id[1]:engine_id[2]]),
+                _ber_to_int(data, boots[1], boots[2]), _ber_to_int(data, enginetime[1], enginetime[2]))
+    finally:
+        sock.close()
+    return None
+
+
+def _engine_path(hostname):
+    return os.path.join(args.state_dir, "{}.engine".format(hostname))
+
+
+def get_engine(hostname):
+    """
+    Returns the (engineID, boots, time) of `hostname` SNMPv3 engine. They are
+    read from the engine cache of `--state-dir` while it is younger than
+    `--engine-cache-ttl` seconds (engine time being extrapolated from the
+    cached sample), otherwise they are discovered and stored in the cache.
+    """
+    path = _engine_path(hostname)
+    now = time.time()
+    try:
+        with open(path) as fd:
+            engine = json.load(fd)
+        age = now - engine['sampled']
+        if 0 <= age < args.engine_cache_ttl:
+            return engine['engine_id'], engine['boots'], engine['time'] + int(age)
+    except (IOError, OSError, ValueError, KeyError):
+        pass
+
+    engine = _discover_engine(hostname)
+    if engine is not None:
+        try:
+            if not os.path.isdir(args.state_dir):
+                os.makedirs(args.state_dir)
+            fd, tmppath = tempfile.mkstemp(dir=args.state_dir)
+            with os.fdopen(fd, 'w') as tmp:
+                json.dump({'engine_id': engine[0], 'boots': engine[1], 'time': engine[2], 'sampled': now}, tmp)
+            os.rename(tmppath, path)
+        except (IOError, OSError):
+            pass
+    return engine
+
+
+def forget_engine(hostname):
+    """
+    Drops the cached engine of `hostname`, so that it is discovered again on
+    next run (eg. after a request failure, as the appliance may have been
+    replaced or its SNMP engine reset)
+    """
+    try:
+        os.remove(_engine_path(hostname))
+    except OSError:
+        pass
+
+
+def open_session(hostname, community):
+    if args.backend == 'rest':
+        global restSession
+        restSession = open_rest_session(args.username, args.password)
+        return None
+    if args.snmp_version == '3':
+        # with the engine known beforehand, net-snmp skips its own discovery
+        # round trip and sends the first request authenticated right away
+        v3args = {}
+        engine = get_engine(hostname)
+        if engine is not None:
+            v3args = dict(SecEngineId=engine[0], ContextEngineId=engine[0], Engineboots=engine[1], Enginetime=engine[2])
+        return netsnmp.Session(Version=3, DestHost=hostname, UseNumeric=1,
+            SecName=args.sec_name, SecLevel=args.sec_level, Context=args.context,
+            AuthProto=args.auth_proto, AuthPass=args.auth_pass or '',
+            PrivProto=args.priv_proto, PrivPass=args.priv_pass or '',
+            Timeout=int(args.snmp_timeout * 1000000), Retries=args.snmp_retries, **v3args)
+    return netsnmp.Session(Version=2, DestHost=hostname, Community=community, UseNumeric=1,
+        Timeout=int(args.snmp_timeout * 1000000), Retries=args.snmp_retries)
+
+
+def snmp_failed(session):
+    return args.backend == 'snmp' and args.snmp_version == '3' and session is not None and session.ErrorNum != 0
+
+
+def run_mode(mode):
+    if mode =='health':
+        return get_health_status(args.perfdata)
+    elif mode == 'enumvs':
+        return enum_virtualservers()
+    elif mode == 'vsstats':
+        return get_vs_stats(args.arg1, args.perfdata)
+    elif mode == 'nodestats':
+        return get_node_stats(args.perfdata)
+    elif mode == 'poolstats':
+        return get_pool_stats(args.perfdata)
+    elif mode == 'http':
+        return get_http_stats(args.perfdata)
+    elif mode == 'mem_tmm':
+        return get_mem_tmm(args.perfdata)
+    elif mode == 'sessions':
+        return get_sessions(args.perfdata)
+    elif mode == 'all-globals':
+        return get_all_globals(args.perfdata)
+    message.append("Unsupported mode '{}'".format(mode))
+    return 3
+
+
+class DeviceTimeout(Exception):
+    pass
+
+
+def _device_timeout(signum, frame):
+    raise DeviceTimeout()
+
+
+def read_inventory(path):
+    """
+    Parse the fleet inventory file, returns a list of devices dicts
+    """
+    inventory = configparser.RawConfigParser()
+    if not inventory.read(path):
+        raise IOError("unable to read inventory file {}".format(path))
+    devices = []
+    for section in inventory.sections():
+        options = dict(inventory.items(section))
+        checks = []
+        for spec in options.get('modes', 'all-globals').split(','):
+            mode, _, arg1 = spec.strip().partition(':')
+            checks.append((mode, arg1 or options.get(mode + '.arg1'),
+                options.get(mode + '.warning'), options.get(mode + '.critical')))
+        devices.append({
+            'host': options.get('address', section),
+            'community': options.get('community'),
+            'backend': options.get('backend', args.backend),
+            'username': options.get('username', args.username),
+            'password': options.get('password', args.password),
+            'nagios_host': options.get('nagios_host', section),
+            'checks': checks,
+        })
+    return devices
+
+
+def _poll_device(device):
+    """
+    Runs the checks of an inventory device, in a worker process of the fleet
+    pool. Returns the device passive results and whether it was fully polled.
+    """
+    global snmpSession
+    del passive[:]
+    args.hostname = device['host']
+    args.passive_host = device['nagios_host']
+    args.backend = device['backend']
+    args.username, args.password = device['username'], device['password']
+    signal.signal(signal.SIGALRM, _device_timeout)
+    signal.alarm(args.device_timeout)
+    completed = True
+    try:
+        snmpSession = open_session(device['host'], device['community'])
+        for mode, arg1, warning, critical in device['checks']:
+            args.arg1, args.warning, args.critical = arg1, warning, critical
+            del message[:]
+            del perfmsg[:]
+            ret = run_mode(mode)
+            if mode == 'all-globals':
+                # sub-checks results already are in `passive`
+                continue
+            service = args.service_prefix + mode + (' ' + arg1 if arg1 else '')
+            passive.append(_passive_result(args.passive_host, service, ret, "".join(message), " ".join(perfmsg)))
+        if snmp_failed(snmpSession):
+            forget_engine(device['host'])
+    except DeviceTimeout:
+        completed = False
+        passive.append(_passive_result(args.passive_host, args.service_prefix + 'fleet', 3,
+            "Polling timed out after {}s".format(args.device_timeout), ''))
+    except Exception as e:
+        completed = False
+        passive.append(_passive_result(args.passive_host, args.service_prefix + 'fleet', 3,
+            "Polling failed: {}".format(e), ''))
+    finally:
+        signal.alarm(0)
+    return list(passive), completed
+
+
+def poll_fleet(inventory):
+    '''
+Polls all the appliances listed in an inventory file (`--inventory`)
+concurrently, with a pool of `--workers` processes, and reports all their
+checks as passive check results (see **all-globals** mode for the output).
+
+The inventory is an INI file with a section per appliance. Options set in the
+`[DEFAULT]` section apply to all appliances:
+
+    [DEFAULT]
+    community = public
+    modes = all-globals
+
+    [bigip1.example.com]
+    modes = all-globals,nodestats,vsstats:/Common/www_vs
+    nodestats.warning = 1000,1000,1000000
+    nodestats.critical = 2000,2000,2000000
+
+    [bigip2]
+    address = 10.0.0.2
+    nagios_host = bigip2.example.com
+    community = secret
+
+* `modes` lists the checks to run, with an optional `--arg1` value after a
+  colon (eg. `vsstats:/Common/www_vs`, `health:warnmissingfan`)
+* `<mode>.warning` and `<mode>.critical` set the triggers of a mode
+* `address` is the SNMP address of the appliance (defaults to section name)
+* `backend`, `username` and `password` select the iControl REST backend
+  (default to `--backend`, `--username` and `--password`)
+* `nagios_host` is the host name of passive results (defaults to section
+  name)
+
+Services are named after the mode (and its argument), prefixed by
+`--service-prefix`. Each appliance is given at most `--device-timeout`
+seconds to complete its checks, so that a slow or unreachable appliance only
+reports an UNKNOWN `fleet` service instead of stalling the whole batch.
+
+The plugin output summarizes how many appliances were successfully polled.
+    '''
+    try:
+        devices = read_inventory(inventory)
+    except (IOError, configparser.Error) as e:
+        message.append(str(e))
+        return 3
+    if not devices:
+        message.append("No appliance found in inventory {}".format(inventory))
+        return 3
+
+    workers = min(args.workers, len(devices))
+    # workers inherit the parsed arguments and state of this process, so they
+    # are forked whatever the default start method (spawn re-runs the script)
+    context = multiprocessing.get_context('fork') if hasattr(multiprocessing, 'get_context') else multiprocessing
+    pool = context.Pool(processes=workers)
+    pending = [(device, pool.apply_async(_poll_device, (device,))) for device in devices]
+    pool.close()
+    # a worker enforces the timeout of its device, this one only guards
+    # against a stuck worker process
+    deadline = time.time() + args.device_timeout * (len(devices) // workers + 1) + 5
+    results = []
+    failed = []
+    for device, pending_result in pending:
+        try:
+            lines, completed = pending_result.get(max(deadline - time.time(), 0))
+        except multiprocessing.TimeoutError:
+            lines, completed = [_passive_result(device['nagios_host'], args.service_prefix + 'fleet', 3,
+                "Polling worker did not answer", '')], False
+        results.extend(lines)
+        if not completed:
+            failed.append(device['nagios_host'])
+    pool.terminate()
+
+    del message[:]
+    del perfmsg[:]
+    passive.extend(results)
+    message.append("{}/{} appliances polled, {} passive results".format(
+        len(devices) - len(failed), len(devices), len(results)))
+    if failed:
+        message.append(" - failed: {}".format(", ".join(failed)))
+        return 3 if len(failed) == len(devices) else 1
+    return 0
+
+
 ##### Main starts here
 
 parser = argparse.ArgumentParser(description='Nagios check for F5 BIG-IP OS-based Load-Balancer')
-parser.add_argument('-H', '--hostname', type=str, help='hostname or IP address', required=True)
-parser.add_argument('-C', '--community', type=str, help='SNMP community (currently only v2c)', required=True)
+parser.add_argument('-H', '--hostname', type=str, help='hostname or IP address', default=None)
+parser.add_argument('-C', '--community', type=str, help='SNMP v2c community', default=None)
+parser.add_argument('-v', '--snmp-version', type=str, help='SNMP version', choices=['2c', '3'], default='2c')
+parser.add_argument('--sec-name', type=str, help='SNMPv3 security name', default=None)
+parser.add_argument('--sec-level', type=str, help='SNMPv3 security level', choices=['noAuthNoPriv', 'authNoPriv', 'authPriv'], default='authPriv')
+parser.add_argument('--auth-proto', type=str, help='SNMPv3 authentication protocol', choices=['MD5', 'SHA'], default='SHA')
+parser.add_argument('--auth-pass', type=str, help='SNMPv3 authentication passphrase', default=None)
+parser.add_argument('--priv-proto', type=str, help='SNMPv3 privacy protocol', choices=['DES', 'AES'], default='AES')
+parser.add_argument('--priv-pass', type=str, help='SNMPv3 privacy passphrase', default=None)
+parser.add_argument('--context', type=str, help='SNMPv3 context name', default='')
+parser.add_argument('--engine-cache-ttl', type=int, help='lifetime in seconds of the cached SNMPv3 engine', default=86400)
+parser.add_argument('-b', '--backend', type=str, help='data retrieval backend', choices=['snmp', 'rest'], default='snmp')
+parser.add_argument('-U', '--username', type=str, help='iControl REST username', default=None)
+parser.add_argument('-P', '--password', type=str, help='iControl REST password', default=None)
+parser.add_argument('--rest-url', type=str, help='iControl REST base URL (defaults to https://<hostname>)', default=None)
+parser.add_argument('--rest-timeout', type=float, help='iControl REST request timeout in seconds', default=10.0)
 parser.add_argument('-m', '--mode', type=str, help='Operational mode',
     choices = [
         'help',
@@ -567,41 +1871,81 @@ parser.add_argument('-m', '--mode', type=str, help='Operational mode',
         'enumvs',
         'vsstats',
         'nodestats',
+        'poolstats',
         'mem_tmm',
         'sessions',
+        'all-globals',
+        'fleet',
     ],
     required=True)
 parser.add_argument('-x', '--arg1', type=str, help='optional argument 1 (eg. vs or node name, health flags)', default=None) 
 parser.add_argument('-p', '--perfdata', help='enable pnp4nagios perfdata', action='store_true')
 parser.add_argument('-w', '--warning', type=str, nargs='?', help='warning trigger', default=10)
 parser.add_argument('-c', '--critical', type=str, nargs='?', help='critical trigger', default=6)
+parser.add_argument('-r', '--max-repetitions', type=int, help='GETBULK max-repetitions used for table walks', default=25)
+parser.add_argument('--cache-ttl', type=int, help='lifetime in seconds of the table cache (0 disables it)', default=0)
+parser.add_argument('--cache-dir', type=str, help='table cache directory', default='/var/tmp/check_f5_big-ip')
+parser.add_argument('--catalog-ttl', type=int, help='maximum age in seconds of the enumvs catalog (0 disables it)', default=3600)
+parser.add_argument('--json', help='print enumvs catalog as JSON', action='store_true')
+parser.add_argument('--state-dir', type=str, help='directory of the counters state files', default='/var/tmp/check_f5_big-ip')
+parser.add_argument('--thresholds', type=str, help='per-object triggers file of vsstats and nodestats modes', default=None)
+parser.add_argument('--top', type=int, help='number of worst objects reported by summaries', default=5)
+parser.add_argument('--passive-host', type=str, help='host name used in passive check results (defaults to --hostname)', default=None)
+parser.add_argument('--service-prefix', type=str, help='prefix of service names used in passive check results', default='')
+parser.add_argument('--cmdfile', type=str, help='Nagios command file where passive check results are written', default=None)
+parser.add_argument('--health-flags', type=str, help='health flags (see health mode) used by all-globals mode', default=None)
+parser.add_argument('--snmp-timeout', type=float, help='SNMP request timeout in seconds', default=1.0)
+parser.add_argument('--snmp-retries', type=int, help='SNMP request retries', default=3)
+parser.add_argument('--inventory', type=str, help='inventory file of fleet mode', default=None)
+parser.add_argument('--workers', type=int, help='number of appliances polled concurrently in fleet mode', default=10)
+parser.add_argument('--device-timeout', type=int, help='time limit in seconds to poll an appliance in fleet mode', default=30)
 
 args = parser.parse_args()
+if args.mode == 'fleet':
+    if args.inventory is None:
+        parser.error('fleet mode requires --inventory')
+elif args.json and args.mode != 'enumvs':
+    parser.error('--json is only supported by enumvs mode')
+elif args.mode != 'help' and args.hostname is None:
+    parser.error("{} mode requires --hostname".format(args.mode))
+elif args.mode != 'help' and args.backend == 'snmp' and args.snmp_version == '2c' and args.community is None:
+    parser.error("{} mode requires --community".format(args.mode))
+elif args.mode != 'help' and args.backend == 'snmp' and args.snmp_version == '3' and args.sec_name is None:
+    parser.error("{} mode requires --sec-name with SNMPv3".format(args.mode))
+elif args.mode != 'help' and args.backend == 'rest' and (args.username is None or args.password is None):
+    parser.error("{} mode requires --username and --password with rest backend".format(args.mode))
 retcode = 3
 message = []
 perfmsg = []
-
-snmpSession = netsnmp.Session(Version=2, DestHost=args.hostname, Community=args.community)
+passive = []
+snmpSession = None
+restSession = None
+tableWalked = None
 
 if args.mode == 'help':
     print_longHelp()
-elif args.mode =='health':
-    retcode = get_health_status(args.perfdata)
-elif args.mode == 'enumvs':
-    retcode = enum_virtualservers()
-elif args.mode == 'vsstats':
-    retcode = get_vs_stats(args.arg1, args.perfdata)
-elif args.mode == 'nodestats':
-    retcode = get_node_stats(args.perfdata)
-elif args.mode == 'http':
-    retcode = get_http_stats(args.perfdata)
-elif args.mode == 'mem_tmm':
-    retcode = get_mem_tmm(args.perfdata)
-elif args.mode == 'sessions':
-    retcode = get_sessions(args.perfdata)
-
-print("{}: ".format(retText[retcode]) + "".join(message))
-if args.perfdata and len(perfmsg):
-    print('|' + " ".join(perfmsg))
+elif args.mode == 'fleet':
+    retcode = poll_fleet(args.inventory)
+else:
+    snmpSession = open_session(args.hostname, args.community)
+    try:
+        retcode = run_mode(args.mode)
+    except (IOError, ValueError) as e:
+        # requests exceptions derive from IOError
+        if args.backend != 'rest':
+            raise
+        retcode = 3
+        message.append("iControl REST request failed: {}".format(e))
+    if snmp_failed(snmpSession):
+        forget_engine(args.hostname)
+
+if passive:
+    submit_passive(passive)
+if args.json:
+    print("".join(message))
+elif not passive or args.cmdfile is not None:
+    print("{}: ".format(retText[retcode]) + "".join(message))
+    if args.perfdata and len(perfmsg):
+        print('|' + " ".join(perfmsg))
 
 exit(retcode)
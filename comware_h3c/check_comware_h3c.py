@@ -7,8 +7,13 @@ Retrieve cpu-load and memory usage on old ComWare equipment throught CLI by SSH
 Published under MIT license
 """
 
-import argparse, paramiko, re
+import argparse, array, fcntl, json, multiprocessing, os, re, signal, socket, struct, sys, time
+try:
+    import configparser
+except ImportError:
+    import ConfigParser as configparser
 from pprint import pprint
+import ssh_phases
 
 __author__ = 'Eric Belhomme'
 __contact__ = 'rico-github@ricozome.net'
@@ -17,7 +22,14 @@ __license__ = 'MIT'
 retcode = 3
 output = []
 perfdata = []
+passive = []
 message = ''
+# duration (s) of the phases of the SSH session
+timings = {}
+# fleet mode concurrency limits, one semaphore per management subnet, and
+# time limit of the whole fleet polling (set in worker processes)
+subnet_slots = {}
+fleet_deadline = None
 
 rettxt = [
     'OK',
@@ -27,6 +39,20 @@ rettxt = [
 ]
 
 re_prompt = re.compile(r"^<.*>.*$")
+# slot number in entPhysicalName of boards (eg. 'Slot 1', 'Board 2')
+re_entity_slot = re.compile(r"(?:Slot|Board|Chassis)\s*(?P<slot>\d+)", re.IGNORECASE)
+
+hh3cEntityColumns = (
+    ('name',      '.1.3.6.1.2.1.47.1.1.1.1.7'),           # entPhysicalName
+    ('cpu',       '.1.3.6.1.4.1.25506.2.6.1.1.1.1.6'),    # hh3cEntityExtCpuUsage
+    ('mem_usage', '.1.3.6.1.4.1.25506.2.6.1.1.1.1.8'),    # hh3cEntityExtMemUsage
+    ('mem_size',  '.1.3.6.1.4.1.25506.2.6.1.1.1.1.10'),   # hh3cEntityExtMemSize
+)
+re_more = re.compile(r"[ \t]*-+ ?More ?-+[ \t]*")
+# cursor moves and blanking sent to erase the `---- More ----` prompt
+re_erase = re.compile(r"\x1b\[\d+D[ \t]*(\x1b\[\d+D)?")
+# windows (minutes) of CPU load averages computed from the history
+cpuHistoryWindows = (5, 15)
 
 
 def process_cpu_usage(bufferOut, warning, critical):
@@ -50,30 +76,133 @@ def process_cpu_usage(bufferOut, warning, critical):
         match = re_cpu.match(line)
         if match:
             cpu_usage.append((slot, match.group('cpu')))
+            if args.slots and len(cpu_usage) >= args.slots:
+                break
 
-    if len(cpu_usage) > 0:
-        avg = 0.0
-        for slot, cpu in cpu_usage:
-            avg += float(cpu)
-        avg = avg / len(cpu_usage)
+    return cpu_usage_status(cpu_usage, warning, critical)
 
-        if avg <= warning:
-            retcode = 0
-        elif avg <= critical:
-            retcode = 1
-        else:
-            retcode = 2
 
-        output.append("{}: Average CPU load : {}%".format(rettxt[retcode], round(avg,2)))
-        if args.perfdata:
-            perfdata.append("avg_cpu={};{};{}".format(cpu, warning, critical))
-        for slot, cpu in cpu_usage:
-            output.append("Slot {} CPU load : {}%".format(slot, cpu))
-            if args.perfdata:
-                perfdata.append("cpu_slot_{}={};{};{}".format(slot, cpu, warning, critical))
-    else:
-        recode = 3
+def _read_cpu_history(fd, size):
+    """
+    Reads a CPU history file: a header (ring size, slots count, next sample
+    position), the slots numbers, the ring of samples timestamps, then a ring
+    of loads per slot (-1 where the slot was not sampled). Returns empty
+    rings if the file is empty, truncated, or of another ring size.
+    """
+    header = array.array('i')
+    slots = array.array('i')
+    stamps = array.array('d')
+    loads = array.array('h')
+    try:
+        header.fromfile(fd, 3)
+        if header[0] != size:
+            raise ValueError()
+        slots.fromfile(fd, header[1])
+        stamps.fromfile(fd, size)
+        loads.fromfile(fd, size * header[1])
+        return slots, stamps, loads, header[2] % size
+    except (EOFError, ValueError):
+        return array.array('i'), array.array('d', [0.0] * size), array.array('h'), 0
+
+
+def cpu_history(cpu_usage):
+    """
+    Stores the CPU load of each slot in the fixed-size ring buffer of the
+    per-host history file of `--state-dir`, and returns a dict of
+    {slot: {window: average load}} over the samples of the last
+    `cpuHistoryWindows` minutes, including the current one.
+    """
+    size = args.history_size
+    now = time.time()
+    current = dict((int(slot), int(cpu)) for slot, cpu in cpu_usage)
+    path = os.path.join(args.state_dir, "{}.cpu".format(args.hostname))
+    try:
+        if not os.path.isdir(args.state_dir):
+            os.makedirs(args.state_dir)
+        with open(path, 'a+b') as fd:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            fd.seek(0)
+            slots, stamps, loads, head = _read_cpu_history(fd, size)
+            for slot in sorted(current):
+                if slot not in slots:
+                    slots.append(slot)
+                    loads.extend([-1] * size)
+            stamps[head] = now
+            for row, slot in enumerate(slots):
+                loads[row * size + head] = current.get(slot, -1)
+            fd.seek(0)
+            fd.truncate()
+            array.array('i', [size, len(slots), (head + 1) % size]).tofile(fd)
+            slots.tofile(fd)
+            stamps.tofile(fd)
+            loads.tofile(fd)
+            fcntl.flock(fd, fcntl.LOCK_UN)
+    except (IOError, OSError):
+        output.append("Unable to store CPU history in {}".format(path))
+        return {}
+
+    averages = {}
+    for window in cpuHistoryWindows:
+        samples = [i for i in range(size) if now - stamps[i] <= window * 60]
+        for row, slot in enumerate(slots):
+            if slot not in current:
+                continue
+            window_loads = [loads[row * size + i] for i in samples if loads[row * size + i] >= 0]
+            averages.setdefault(slot, {})[window] = float(sum(window_loads)) / len(window_loads)
+    return averages
+
+
+def _windows_text(loads):
+    windows = [w for w in sorted(loads) if w > 1]
+    if not windows:
+        return ''
+    return " ({})".format(", ".join("{} min: {}%".format(w, round(loads[w], 2)) for w in windows))
+
+
+def cpu_usage_status(cpu_usage, warning, critical):
+    """
+    Evaluates the CPU load of the switch from its (slot, cpu load) list.
+    Triggers apply to the average load of slots, or to the busiest slot with
+    `--max-slot`, over the last minute, or over the `--window` history.
+    """
+    retcode = 3
+    if len(cpu_usage) == 0:
         output.append('{}: No CPU slot found !'.format(rettxt[retcode]))
+        return retcode
+
+    history = cpu_history(cpu_usage) if args.history_size else {}
+    loads = {}
+    for slot, cpu in cpu_usage:
+        loads[int(slot)] = {1: float(cpu)}
+        loads[int(slot)].update(history.get(int(slot), {}))
+    windows = sorted(set(window for slot in loads for window in loads[slot]))
+    avg = dict((window, sum(loads[slot][window] for slot in loads) / len(loads)) for window in windows)
+    busiest = dict((window, max(loads, key=lambda slot: loads[slot][window])) for window in windows)
+
+    window = args.window if args.window in avg else 1
+    if args.max_slot:
+        value = loads[busiest[window]][window]
+    else:
+        value = avg[window]
+    if value <= warning:
+        retcode = 0
+    elif value <= critical:
+        retcode = 1
+    else:
+        retcode = 2
+
+    output.append("{}: Average CPU load : {}%{}".format(rettxt[retcode], round(avg[1], 2), _windows_text(avg)))
+    output.append("Busiest slot : {} ({}%)".format(busiest[window], round(loads[busiest[window]][window], 2)))
+    if args.perfdata:
+        for w in windows:
+            suffix = "_{}m".format(w) if w > 1 else ""
+            perfdata.append("avg_cpu{}={};{};{}".format(suffix, round(avg[w], 2), warning, critical))
+            perfdata.append("max_cpu{}={};{};{}".format(suffix, round(loads[busiest[w]][w], 2), warning, critical))
+    for slot, cpu in cpu_usage:
+        output.append("Slot {} CPU load : {}%{}".format(slot, cpu, _windows_text(loads[int(slot)])))
+        if args.perfdata:
+            perfdata.append("cpu_slot_{}={};{};{}".format(slot, cpu, warning, critical))
+    return retcode
 
 
 def process_memory_usage(bufferOut, warning, critical):
@@ -82,11 +211,11 @@ def process_memory_usage(bufferOut, warning, critical):
     re_used = re.compile(r'^Total Used.*:\s+(?P<used>\d+).*$')
 
     retcode = 3
-    total, used = 1, 0
+    total, used = None, None
 
     for line in bufferOut:
 
-        if re_prompt.match(line) and total is not 1 and used is not 0:
+        if re_prompt.match(line):
             break
 
         match = re_total.match(line)
@@ -97,6 +226,22 @@ def process_memory_usage(bufferOut, warning, critical):
         if match:
             used = match.group('used')
 
+        if total is not None and used is not None:
+            break
+
+    return memory_usage_status(total, used, warning, critical)
+
+
+def memory_usage_status(total, used, warning, critical):
+    """
+    Evaluates the memory usage of the switch from its total and used memory
+    (bytes)
+    """
+    retcode = 3
+    if total is None or used is None:
+        output.append('{}: No memory usage found !'.format(rettxt[retcode]))
+        return retcode
+
     ratio = (int(used) * 100) / int(total)
     warn = (int(total) * warning) / 100
     crit = (int(total) * critical) / 100
@@ -110,36 +255,547 @@ def process_memory_usage(bufferOut, warning, critical):
     output.append("{}: Memory usage : {} MB / {} MB ({}%)".format(rettxt[retcode], int(used)/1024/1024, int(total)/1024/1024, round(ratio,2)))
     if args.perfdata:
         perfdata.append("memory={};{};{};0;{}".format(used, warn, crit, total))
+    return retcode
+
+
+def snmp_walk(columns):
+    """
+    Walks table `columns` ((name, oid) tuples) with GETBULK requests, all
+    columns within the same PDUs, and returns a dict of {index: {name: value}}
+    """
+    import netsnmp
+    session = netsnmp.Session(Version=2, DestHost=args.hostname, Community=args.community, UseNumeric=1,
+        Timeout=int(args.snmp_timeout * 1000000), Retries=args.snmp_retries)
+    rows = {}
+    cursors = [(name, oid, oid) for name, oid in columns]
+    while cursors:
+        varlist = netsnmp.VarList(*[netsnmp.Varbind(cursor) for name, oid, cursor in cursors])
+        session.getbulk(0, args.max_repetitions, varlist)
+        if not len(varlist):
+            break
+        varbinds = list(varlist)
+        next_cursors = []
+        for col, (name, oid, cursor) in enumerate(cursors):
+            for vb in varbinds[col::len(cursors)]:
+                tag = vb.tag if vb.tag.startswith('.') else '.' + vb.tag
+                if vb.iid not in (None, ''):
+                    tag += '.' + str(vb.iid)
+                if vb.type in ('ENDOFMIBVIEW', 'NOSUCHOBJECT', 'NOSUCHINSTANCE') or not tag.startswith(oid + '.'):
+                    break
+                rows.setdefault(tag[len(oid) + 1:], {})[name] = vb.val
+                cursor = tag
+            else:
+                next_cursors.append((name, oid, cursor))
+        cursors = next_cursors
+    return rows
+
+
+def snmp_boards():
+    """
+    Returns the (slot, cpu load %, memory size in bytes, memory usage %) of
+    the switch boards (entities having memory), sorted by slot, from a single
+    bulk walk of HH3C-ENTITY-EXT-MIB. Slots are numbered after entPhysicalName,
+    or in table order when the name holds no slot number. Returns None if the
+    switch did not answer.
+    """
+    rows = snmp_walk(hh3cEntityColumns)
+    boards = []
+    for index in sorted(rows, key=int):
+        row = rows[index]
+        if int(row.get('mem_size') or 0) == 0:
+            continue
+        match = re_entity_slot.search(row.get('name') or '')
+        slot = int(match.group('slot')) if match else len(boards) + 1
+        boards.append((slot, int(row.get('cpu') or 0), int(row['mem_size']), int(row.get('mem_usage') or 0)))
+    return sorted(boards) or None
+
+
+def snmp_cpu_usage(boards, warning, critical):
+    return cpu_usage_status([(slot, cpu) for slot, cpu, mem_size, mem_usage in boards], warning, critical)
+
+
+def snmp_memory_usage(boards, warning, critical):
+    # as `dis memory`, report the memory of the first slot
+    slot, cpu, mem_size, mem_usage = boards[0]
+    return memory_usage_status(mem_size, mem_size * mem_usage // 100, warning, critical)
+
+
+def timing_perfdata():
+    """
+    Returns the perfdata of the SSH phases timed so far, with `--timing`
+    """
+    if not args.timing:
+        return []
+    return ssh_phases.timing_perfdata(timings)
+
+
+def read_lines(channel):
+    """
+    Yields the lines output on `channel` as they arrive, until the CLI prompt
+    (`re_prompt`) shows up or the channel is closed. `---- More ----` paging
+    prompts are answered on the fly, and stripped from the output.
+    """
+    pending = ''
+    while not re_prompt.match(pending):
+        try:
+            data = channel.recv(4096)
+        except ssh_phases.sshErrors as e:
+            raise ssh_phases.SSHReadError(e)
+        if not data:
+            if pending:
+                yield pending
+            return
+        pending = re_erase.sub('', pending + data.decode('utf-8', 'replace'))
+        if re_more.search(pending):
+            pending = re_more.sub('', pending)
+            channel.send(' ')
+        lines = re.split(r'\r\n|\n|\r', pending)
+        pending = lines.pop()
+        for line in lines:
+            yield line
+
+
+def ssh_connect():
+    """
+    Connects and authenticates to the switch, and returns the SSH transport
+    """
+    return ssh_phases.connect(args.hostname, args.username, args.password, args.timeout, timings, args.port)
+
+
+def ssh_exec(transport, command):
+    """
+    Runs `command` on a new channel of `transport`, and returns the channel
+    """
+    with ssh_phases.phase('t_exec', timings):
+        channel = transport.open_session(timeout=args.timeout)
+        channel.settimeout(args.timeout)
+        channel.exec_command(command)
+    return channel
+
+
+def open_shell(transport):
+    """
+    Opens an interactive shell, and waits for its first CLI prompt
+    """
+    with ssh_phases.phase('t_exec', timings):
+        channel = transport.open_session(timeout=args.timeout)
+        channel.settimeout(args.timeout)
+        # a wide terminal keeps long lines from being wrapped
+        channel.get_pty(width=512)
+        channel.invoke_shell()
+        for command in (None, 'screen-length disable'):
+            if command is not None:
+                channel.send(command + '\n')
+            for line in read_lines(channel):
+                pass
+    return channel
+
+
+def shell_command(channel, command):
+    """
+    Sends `command` to an interactive shell, and yields its output lines as
+    they arrive, up to the next CLI prompt
+    """
+    channel.send(command + '\n')
+    lines = read_lines(channel)
+    # first line is the echoed command
+    next(lines, None)
+    for line in lines:
+        yield line
+
+
+def broker_commands(commands):
+    """
+    Runs `commands` through the SSH session broker (comware_ssh_broker.py)
+    listening on `--broker` Unix socket, which reuses its authenticated
+    connection to the switch. Returns their outputs as lists of lines, or
+    None if the broker is not available or failed to run them.
+    """
+    request = {
+        'hostname': args.hostname,
+        'port': args.port,
+        'username': args.username,
+        'password': args.password,
+        'commands': commands,
+    }
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.settimeout(args.broker_timeout)
+    try:
+        sock.connect(args.broker)
+        sock.sendall(json.dumps(request).encode('utf-8') + b'\n')
+        response = json.loads(sock.makefile('rb').readline().decode('utf-8'))
+    except (socket.error, ValueError):
+        return None
+    finally:
+        sock.close()
+    return response.get('outputs')
+
+
+def run_check(command, process, snmp_process):
+    """
+    Runs `command` on the switch and feeds its output to the `process` parser
+    as it arrives. The connection is closed as soon as the parser has found
+    all its values, without waiting for the rest of the output.
+
+    With the SNMP backend, values are evaluated by `snmp_process` from the
+    switch boards instead, SSH being only used if SNMP fails.
+    """
+    if args.backend == 'snmp':
+        boards = snmp_boards()
+        if boards is not None:
+            return snmp_process(boards, args.warning, args.critical)
+        if args.username is None:
+            output.append("{}: No SNMP answer from {}".format(rettxt[3], args.hostname))
+            return 3
+    if args.broker is not None:
+        outputs = broker_commands([command])
+        if outputs is not None:
+            return process(outputs[0], args.warning, args.critical)
+    transport = ssh_connect()
+    try:
+        channel = ssh_exec(transport, command)
+        start = time.time()
+        ret = process(read_lines(channel), args.warning, args.critical)
+        timings['t_read'] = time.time() - start
+    finally:
+        transport.close()
+    perfdata.extend(timing_perfdata())
+    return ret
+
+
+def submit_passive(results):
+    """
+    Reports the (host, service, state, output, perfdata) passive check
+    `results` as Nagios PROCESS_SERVICE_CHECK_RESULT external commands,
+    written to `--cmdfile`, or printed on stdout when it is not set
+    """
+    now = int(time.time())
+    commands = []
+    for host, service, ret, text, perf in results:
+        # multi-lines outputs are escaped as Nagios expects them
+        text = text.strip().replace('\\', '\\\\').replace('\n', '\\n')
+        commands.append("[{}] PROCESS_SERVICE_CHECK_RESULT;{};{};{};{}{}\n".format(
+            now, host, service, ret, text, '|' + perf if perf else ''))
+    if args.cmdfile is None:
+        sys.stdout.write("".join(commands))
+        return
+    # one write per command so that lines are not interleaved with other
+    # writers of the Nagios command pipe
+    fd = os.open(args.cmdfile, os.O_WRONLY | os.O_APPEND)
+    try:
+        for command in commands:
+            os.write(fd, command.encode('utf-8'))
+    finally:
+        os.close(fd)
+
+
+def check_all(warning, critical):
+    """
+    Runs `dis cpu-usage` and `dis memory` within a single SSH session (or
+    a single SNMP walk), and reports both checks as passive check results.
+    Returns the worst state.
+    """
+    checks = (
+        ('cpu-load', 'dis cpu-usage', process_cpu_usage, snmp_cpu_usage),
+        ('memory', 'dis memory', process_memory_usage, snmp_memory_usage),
+    )
+    boards = None
+    if args.backend == 'snmp':
+        boards = snmp_boards()
+        if boards is None and args.username is None:
+            output.append("{}: No SNMP answer from {}".format(rettxt[3], args.hostname))
+            return 3
+    stdouts = None
+    if boards is None and args.broker is not None:
+        stdouts = broker_commands([check[1] for check in checks])
+    transport = None
+    if boards is None and stdouts is None:
+        transport = ssh_connect()
+
+    host = args.passive_host or args.hostname
+    retcode = 0
+    checked = []
+    states = []
+    try:
+        if transport is not None:
+            channel = open_shell(transport)
+        for pos, (service, command, process, snmp_process) in enumerate(checks):
+            del output[:]
+            del perfdata[:]
+            if boards is not None:
+                ret = snmp_process(boards, warning, critical)
+            else:
+                if transport is None:
+                    lines = iter(stdouts[pos])
+                else:
+                    lines = shell_command(channel, command)
+                start = time.time()
+                ret = process(lines, warning, critical)
+                if pos < len(checks) - 1:
+                    # skip what the parser did not need, up to the prompt
+                    for line in lines:
+                        pass
+                if transport is not None:
+                    timings['t_read'] = timings.get('t_read', 0) + time.time() - start
+            checked.append((service, ret, "\n".join(output), list(perfdata)))
+            states.append("{} {}".format(service, rettxt[ret]))
+            if ret > retcode:
+                retcode = ret
+    finally:
+        if transport is not None:
+            transport.close()
+
+    # the session timings (of both commands) go along every result
+    results = [(host, args.service_prefix + service, ret, text, " ".join(perf + timing_perfdata()))
+        for service, ret, text, perf in checked]
+    del output[:]
+    del perfdata[:]
+    passive.extend(results)
+    output.append("{}: {} passive results: {}".format(rettxt[retcode], len(results), ", ".join(states)))
+    return retcode
+
+
+def run_type(check):
+    if check == 'cpu-load':
+        return run_check('dis cpu-usage', process_cpu_usage, snmp_cpu_usage)
+    elif check == 'memory':
+        return run_check('dis memory', process_memory_usage, snmp_memory_usage)
+    elif check == 'all':
+        return check_all(args.warning, args.critical)
+    return 3
+
+
+class DeviceTimeout(Exception):
+    pass
+
+
+def _device_timeout(signum, frame):
+    raise DeviceTimeout()
+
+
+def _subnet(address):
+    """
+    Returns the `--subnet-prefix` network of `address`, which keys the
+    concurrency limit of fleet mode
+    """
+    try:
+        ip = struct.unpack('!I', socket.inet_aton(socket.gethostbyname(address)))[0]
+    except (socket.error, struct.error):
+        return address
+    mask = (0xffffffff << (32 - args.subnet_prefix)) & 0xffffffff
+    return "{}/{}".format(socket.inet_ntoa(struct.pack('!I', ip & mask)), args.subnet_prefix)
+
+
+def read_inventory(path):
+    """
+    Parse the fleet inventory file, returns a list of switches dicts
+    """
+    inventory = configparser.RawConfigParser()
+    if not inventory.read(path):
+        raise IOError("unable to read inventory file {}".format(path))
+    switches = []
+    for section in inventory.sections():
+        options = dict(inventory.items(section))
+        address = options.get('address', section)
+        switches.append({
+            'hostname': address,
+            'port': int(options.get('port', args.port)),
+            'nagios_host': options.get('nagios_host', section),
+            'types': [check.strip() for check in options.get('types', 'all').split(',')],
+            'username': options.get('username', args.username),
+            'password': options.get('password', args.password),
+            'backend': options.get('backend', args.backend),
+            'community': options.get('community', args.community),
+            'warning': int(options.get('warning', args.warning)),
+            'critical': int(options.get('critical', args.critical)),
+            'slots': int(options.get('slots', args.slots)),
+            'subnet': _subnet(address),
+        })
+    return switches
+
+
+def _init_worker(slots, deadline):
+    """
+    Initializes a worker process of the fleet pool with the per-subnet
+    semaphores, shared by all workers, and the fleet polling deadline
+    """
+    global subnet_slots, fleet_deadline
+    subnet_slots = slots
+    fleet_deadline = deadline
+
+
+def _interleave(switches):
+    """
+    Orders `switches` round-robin across their management subnets, so that
+    pool workers waiting for the slots of a busy subnet are followed by
+    switches of other subnets, instead of holding all the workers
+    """
+    subnets = []
+    queues = {}
+    for switch in switches:
+        if switch['subnet'] not in queues:
+            subnets.append(switch['subnet'])
+            queues[switch['subnet']] = []
+        queues[switch['subnet']].append(switch)
+    ordered = []
+    for rank in range(max(len(queue) for queue in queues.values())):
+        ordered.extend(queues[subnet][rank] for subnet in subnets if rank < len(queues[subnet]))
+    return ordered
+
+
+def _poll_switch(switch):
+    """
+    Runs the checks of an inventory switch, in a worker process of the fleet
+    pool. Returns the switch passive results and whether it was fully polled.
+    """
+    del passive[:]
+    timings.clear()
+    for option in ('hostname', 'port', 'username', 'password', 'backend', 'community', 'warning', 'critical', 'slots'):
+        setattr(args, option, switch[option])
+    args.passive_host = switch['nagios_host']
+    completed = True
+    slots = subnet_slots[switch['subnet']]
+    # wait no longer than leaves the time to poll the switch before the
+    # fleet deadline, when its result would be dropped anyway
+    wait = max(fleet_deadline - time.time() - args.device_timeout, 0)
+    if not slots.acquire(True, wait):
+        return [(args.passive_host, args.service_prefix + 'fleet', 3,
+            "No polling slot freed in subnet {} within {}s".format(switch['subnet'], int(wait)), '')], False
+    signal.signal(signal.SIGALRM, _device_timeout)
+    signal.alarm(args.device_timeout)
+    try:
+        for check in switch['types']:
+            del output[:]
+            del perfdata[:]
+            ret = run_type(check)
+            if check != 'all':
+                # `all` results already are in `passive`
+                passive.append((args.passive_host, args.service_prefix + check, ret,
+                    "\n".join(output), " ".join(perfdata)))
+    except DeviceTimeout:
+        completed = False
+        passive.append((args.passive_host, args.service_prefix + 'fleet', 3,
+            "Polling timed out after {}s".format(args.device_timeout), ''))
+    except Exception as e:
+        completed = False
+        passive.append((args.passive_host, args.service_prefix + 'fleet', 3,
+            "Polling failed: {}".format(e), ''))
+    finally:
+        signal.alarm(0)
+        slots.release()
+    return list(passive), completed
+
+
+def poll_fleet(inventory):
+    """
+    Polls all the switches of an inventory file concurrently, with a pool of
+    `--workers` processes and at most `--subnet-limit` switches at once per
+    management subnet, and reports their checks as passive check results
+    """
+    try:
+        switches = read_inventory(inventory)
+    except (IOError, ValueError, configparser.Error) as e:
+        output.append("{}: {}".format(rettxt[3], e))
+        return 3
+    if not switches:
+        output.append("{}: No switch found in inventory {}".format(rettxt[3], inventory))
+        return 3
+
+    # workers inherit the parsed arguments and state of this process, so they
+    # are forked whatever the default start method (spawn re-runs the script)
+    context = multiprocessing.get_context('fork') if hasattr(multiprocessing, 'get_context') else multiprocessing
+    slots = {}
+    for switch in switches:
+        if switch['subnet'] not in slots:
+            slots[switch['subnet']] = context.BoundedSemaphore(args.subnet_limit)
+    workers = min(args.workers, len(switches))
+    # a worker enforces the timeout of its switch, this one only guards
+    # against a stuck worker process
+    deadline = time.time() + args.device_timeout * (len(switches) // min(workers, args.subnet_limit) + 1) + 5
+    # semaphores can only be handed to workers when they are started
+    pool = context.Pool(processes=workers, initializer=_init_worker, initargs=(slots, deadline))
+    pending = [(switch, pool.apply_async(_poll_switch, (switch,))) for switch in _interleave(switches)]
+    pool.close()
+    results = []
+    failed = []
+    for switch, pending_result in pending:
+        try:
+            checks, completed = pending_result.get(max(deadline - time.time(), 0))
+        except multiprocessing.TimeoutError:
+            checks, completed = [(switch['nagios_host'], args.service_prefix + 'fleet', 3,
+                "Polling worker did not answer", '')], False
+        results.extend(checks)
+        if not completed:
+            failed.append(switch['nagios_host'])
+    pool.terminate()
+
+    del output[:]
+    del perfdata[:]
+    passive.extend(results)
+    retcode = 0
+    if failed:
+        retcode = 3 if len(failed) == len(switches) else 1
+    output.append("{}: {}/{} switches polled, {} passive results".format(
+        rettxt[retcode], len(switches) - len(failed), len(switches), len(results)))
+    if failed:
+        output.append("failed: {}".format(", ".join(failed)))
+    return retcode
 
 
 parser = argparse.ArgumentParser(description='Nagios check for ComWare switch')
-parser.add_argument('-H', '--hostname', type=str, help='hostname or IP address', required=True)
-parser.add_argument('-U', '--username', type=str, help='username', required=True)
-parser.add_argument('-P', '--password', type=str, help='user password', required=True)
-parser.add_argument('-t', '--type', type=str, help='check type', choices=['cpu-load', 'memory'], required=True)
+parser.add_argument('-H', '--hostname', type=str, help='hostname or IP address', default=None)
+parser.add_argument('--port', type=int, help='SSH port', default=22)
+parser.add_argument('-U', '--username', type=str, help='username', default=None)
+parser.add_argument('-P', '--password', type=str, help='user password', default=None)
+parser.add_argument('-b', '--backend', type=str, help='data retrieval backend', choices=['ssh', 'snmp'], default='ssh')
+parser.add_argument('-C', '--community', type=str, help='SNMP v2c community', default=None)
+parser.add_argument('-r', '--max-repetitions', type=int, help='GETBULK max-repetitions of SNMP walks', default=50)
+parser.add_argument('--snmp-timeout', type=float, help='SNMP request timeout in seconds', default=1.0)
+parser.add_argument('--snmp-retries', type=int, help='SNMP request retries', default=2)
+parser.add_argument('-t', '--type', type=str, help='check type', choices=['cpu-load', 'memory', 'all', 'fleet'], required=True)
 parser.add_argument('-p', '--perfdata', help='enable pnp4nagios perfdata', action='store_true')
 parser.add_argument('-w', '--warning', type=int, nargs='?', help='warning trigger', default=80)
 parser.add_argument('-c', '--critical', type=int, nargs='?', help='critical trigger', default=90)
+parser.add_argument('-S', '--broker', type=str, help='SSH session broker Unix socket (falls back to direct SSH)', default=None)
+parser.add_argument('--broker-timeout', type=int, help='SSH session broker timeout in seconds', default=30)
+parser.add_argument('--timeout', type=int, help='command output timeout in seconds', default=30)
+parser.add_argument('--timing', help='add the duration of SSH session phases to perfdata', action='store_true')
+parser.add_argument('--slots', type=int, help='number of CPU slots, to stop reading as soon as all are found', default=0)
+parser.add_argument('--state-dir', type=str, help='directory of the CPU history files', default='/var/tmp/check_comware_h3c')
+parser.add_argument('--history-size', type=int, help='number of CPU samples kept per slot (0 disables the history)', default=64)
+parser.add_argument('--window', type=int, help='minutes of CPU load history the triggers apply to', choices=[1] + list(cpuHistoryWindows), default=1)
+parser.add_argument('--max-slot', help='apply CPU triggers to the busiest slot instead of the average', action='store_true')
+parser.add_argument('--passive-host', type=str, help='host name used in passive check results of `all` type (defaults to --hostname)', default=None)
+parser.add_argument('--service-prefix', type=str, help='prefix of service names used in passive check results', default='')
+parser.add_argument('--cmdfile', type=str, help='Nagios command file where passive check results are written', default=None)
+parser.add_argument('--inventory', type=str, help='inventory file of fleet type', default=None)
+parser.add_argument('--workers', type=int, help='number of switches polled concurrently in fleet type', default=20)
+parser.add_argument('--subnet-limit', type=int, help='number of switches polled concurrently per management subnet', default=5)
+parser.add_argument('--subnet-prefix', type=int, help='prefix length of management subnets', default=24)
+parser.add_argument('--device-timeout', type=int, help='time limit in seconds to poll a switch in fleet type', default=60)
 args = parser.parse_args()
-
-ssh = paramiko.SSHClient()
-ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+if args.type == 'fleet':
+    if args.inventory is None:
+        parser.error('fleet type requires --inventory')
+elif args.hostname is None:
+    parser.error('--hostname is required')
+elif args.backend == 'snmp' and args.community is None:
+    parser.error('snmp backend requires --community')
+elif args.backend == 'ssh' and (args.username is None or args.password is None):
+    parser.error('ssh backend requires --username and --password')
 
 try:
-    ssh.connect( args.hostname, username=args.username, password=args.password, look_for_keys=False)
-    
-    if args.type.startswith('cpu-load'):
-        stdin, stdout, stderr = ssh.exec_command('dis cpu-usage')
-        stdout=stdout.readlines()
-        retcode = process_cpu_usage(stdout, args.warning, args.critical)
-    elif args.type.startswith('memory'):
-        stdin, stdout, stderr = ssh.exec_command('dis memory')
-        stdout=stdout.readlines()
-        retcode = process_memory_usage(stdout, args.warning, args.critical)
-
-    ssh.close()
-except:
-    output.append("{}: Failed to connect on {} as user '{}'".format(rettxt[retcode], args.hostname, args.username))
+    if args.type == 'fleet':
+        retcode = poll_fleet(args.inventory)
+    else:
+        retcode = run_type(args.type)
+except ssh_phases.SSHPhaseError as e:
+    del output[:]
+    output.append("{}: {} (on {} as user '{}')".format(rettxt[3], e, args.hostname, args.username))
+    perfdata.extend(timing_perfdata())
+except Exception as e:
+    del output[:]
+    output.append("{}: Check failed on {}: {}".format(rettxt[3], args.hostname, e))
 
 for out in output:
     message += "{}\n".format(out)
@@ -148,5 +804,8 @@ if len(perfdata):
     for out in perfdata:
         message += "{} ".format(out)
 
-print(message)
+if passive:
+    submit_passive(passive)
+if not passive or args.cmdfile is not None:
+    print(message)
 exit(retcode)
@@ -0,0 +1,190 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim: expandtab sw=4 ts=4:
+"""
+SSH session broker for check_comware_h3c.py: keeps one authenticated SSH
+transport per switch, and runs the commands sent by check invocations over a
+Unix socket, so that they don't pay a TCP connection, key exchange and
+password authentication on every check.
+Published under MIT license
+"""
+
+import argparse, hashlib, json, os, paramiko, socket, stat, threading, time
+try:
+    import socketserver
+except ImportError:
+    import SocketServer as socketserver
+
+__author__ = 'Eric Belhomme'
+__contact__ = 'rico-github@ricozome.net'
+__license__ = 'MIT'
+
+
+class CommandError(Exception):
+    """
+    Command exited with a non-zero `status` on the switch
+    """
+
+    def __init__(self, command, status, errors):
+        Exception.__init__(self, "'{}' exited with status {}{}".format(command, status, ": " + errors if errors else ""))
+        self.status = status
+
+
+class Connection(object):
+    """
+    Authenticated SSH connection to a switch. Commands are serialized, as
+    old switches only accept a few concurrent channels.
+    """
+
+    def __init__(self, hostname, port, username, password):
+        self.hostname = hostname
+        self.port = port
+        self.username = username
+        self.password = password
+        self.lock = threading.Lock()
+        self.client = None
+        self.last_used = time.time()
+
+    def connect(self):
+        self.close()
+        self.client = paramiko.SSHClient()
+        self.client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+        self.client.connect(self.hostname, port=self.port, username=self.username, password=self.password,
+            look_for_keys=False, allow_agent=False, timeout=args.connect_timeout)
+        self.client.get_transport().set_keepalive(args.keepalive)
+
+    def close(self):
+        if self.client is not None:
+            self.client.close()
+            self.client = None
+
+    def is_active(self):
+        return self.client is not None and self.client.get_transport() is not None \
+            and self.client.get_transport().is_active()
+
+    def _run(self, commands):
+        outputs = []
+        for command in commands:
+            stdin, stdout, stderr = self.client.exec_command(command, timeout=args.command_timeout)
+            # stderr is drained while stdout is read, so that it can't fill
+            # the channel window and stall the command
+            errors = []
+            reader = threading.Thread(target=lambda: errors.append(stderr.read()))
+            reader.daemon = True
+            reader.start()
+            lines = stdout.readlines()
+            reader.join(args.command_timeout)
+            # the exit status stays -1 when the switch does not report it
+            status = stdout.channel.recv_exit_status()
+            if status > 0:
+                # the error output is drained whole, but only its start is reported
+                raise CommandError(command, status, b"".join(errors)[:1024].decode('utf-8', 'replace').strip())
+            outputs.append(lines)
+        return outputs
+
+    def run(self, commands):
+        """
+        Runs `commands` and returns their outputs as lists of lines. The
+        switch is connected on first use, and connected again if the
+        connection is found broken.
+        """
+        with self.lock:
+            self.last_used = time.time()
+            if not self.is_active():
+                self.connect()
+                return self._run(commands)
+            try:
+                return self._run(commands)
+            except (paramiko.SSHException, socket.error, EOFError):
+                # the switch may have dropped an idle session: reconnect once
+                self.connect()
+                return self._run(commands)
+            finally:
+                self.last_used = time.time()
+
+
+class Broker(object):
+
+    def __init__(self):
+        self.connections = {}
+        self.lock = threading.Lock()
+
+    def get_connection(self, hostname, port, username, password):
+        # the password is part of the key, so that a request can't use a
+        # session authenticated with other credentials
+        key = (hostname, port, username, hashlib.sha256(password.encode('utf-8')).hexdigest())
+        with self.lock:
+            if key not in self.connections:
+                self.connections[key] = Connection(hostname, port, username, password)
+            return self.connections[key]
+
+    def evict_idle(self):
+        """
+        Closes connections unused for `--idle-timeout` seconds
+        """
+        now = time.time()
+        with self.lock:
+            for key, connection in list(self.connections.items()):
+                if now - connection.last_used > args.idle_timeout and connection.lock.acquire(False):
+                    try:
+                        connection.close()
+                        del self.connections[key]
+                    finally:
+                        connection.lock.release()
+
+    def reaper(self):
+        while True:
+            time.sleep(min(args.idle_timeout, 30))
+            self.evict_idle()
+
+
+class RequestHandler(socketserver.StreamRequestHandler):
+    """
+    Handles one request per client connection: a JSON line with `hostname`,
+    `port` (defaults to 22), `username`, `password` and a list of `commands`,
+    answered by a JSON line holding either the `outputs` of the commands or
+    an `error`.
+    """
+
+    def handle(self):
+        try:
+            request = json.loads(self.rfile.readline().decode('utf-8'))
+            connection = broker.get_connection(request['hostname'], int(request.get('port', 22)),
+                request['username'], request['password'])
+            response = {'outputs': connection.run(request['commands'])}
+        except (ValueError, KeyError, TypeError) as e:
+            response = {'error': "Invalid request: {}".format(e)}
+        except Exception as e:
+            response = {'error': "{}: {}".format(type(e).__name__, e)}
+        self.wfile.write(json.dumps(response).encode('utf-8') + b'\n')
+
+
+class BrokerServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+parser = argparse.ArgumentParser(description='SSH session broker for ComWare switches checks')
+parser.add_argument('-s', '--socket', type=str, help='Unix socket path', default='/var/tmp/comware_ssh_broker.sock')
+parser.add_argument('-i', '--idle-timeout', type=int, help='seconds after which an unused connection is closed', default=300)
+parser.add_argument('--connect-timeout', type=int, help='SSH connection timeout in seconds', default=10)
+parser.add_argument('--command-timeout', type=int, help='command output timeout in seconds', default=30)
+parser.add_argument('--keepalive', type=int, help='SSH keepalive interval in seconds', default=60)
+args = parser.parse_args()
+
+broker = Broker()
+
+if os.path.exists(args.socket) and stat.S_ISSOCK(os.stat(args.socket).st_mode):
+    os.remove(args.socket)
+# the socket gives access to authenticated sessions: restrict it to its owner
+os.umask(0o077)
+server = BrokerServer(args.socket, RequestHandler)
+reaper = threading.Thread(target=broker.reaper)
+reaper.daemon = True
+reaper.start()
+try:
+    server.serve_forever()
+except KeyboardInterrupt:
+    pass
+finally:
+    server.server_close()
+    os.remove(args.socket)
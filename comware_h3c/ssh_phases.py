@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+# vim: expandtab sw=4 ts=4:
+"""
+SSH sessions run phase by phase: TCP connection, key exchange,
+authentication, command execution and output reading are each timed, and a
+failure raises the SSHPhaseError subclass of the phase that failed.
+Published under MIT license
+"""
+
+# This module is shipped with both comware_h3c/check_comware_h3c.py and
+# forti_palo_ospf/check_fw_ospf_routes.py, each plugin being installed on its
+# own: both copies must be kept in sync.
+
+import contextlib, paramiko, socket, time
+
+__author__ = 'Eric Belhomme'
+__contact__ = 'rico-github@ricozome.net'
+__license__ = 'MIT'
+
+# phases timings names, in session order
+phases = ('t_connect', 't_kex', 't_auth', 't_exec', 't_read')
+
+# errors of an SSH session, whatever the phase
+sshErrors = (paramiko.SSHException, socket.error, EOFError)
+
+
+class SSHPhaseError(Exception):
+    """
+    Failure of a phase of the SSH session, named by `phase`
+    """
+    phase = None
+    description = 'SSH session'
+
+    def __init__(self, error):
+        Exception.__init__(self, "{} failed: {}".format(self.description, error))
+        self.error = error
+
+
+class SSHConnectError(SSHPhaseError):
+    phase = 't_connect'
+    description = 'TCP connection'
+
+
+class SSHKexError(SSHPhaseError):
+    phase = 't_kex'
+    description = 'SSH key exchange'
+
+
+class SSHAuthError(SSHPhaseError):
+    phase = 't_auth'
+    description = 'SSH authentication'
+
+
+class SSHExecError(SSHPhaseError):
+    phase = 't_exec'
+    description = 'command execution'
+
+
+class SSHReadError(SSHPhaseError):
+    phase = 't_read'
+    description = 'output reading'
+
+
+# phase timing name -> its error class
+phaseErrors = dict((error.phase, error) for error in (SSHConnectError, SSHKexError, SSHAuthError, SSHExecError, SSHReadError))
+
+
+@contextlib.contextmanager
+def phase(name, timings):
+    """
+    Times the enclosed phase `name` of an SSH session in the `timings` dict,
+    and turns its errors into the SSHPhaseError subclass of the phase
+    """
+    start = time.time()
+    try:
+        yield
+    except sshErrors as e:
+        raise phaseErrors[name](e)
+    timings[name] = time.time() - start
+
+
+def connect(hostname, username, password, timeout, timings, port=22):
+    """
+    Connects and authenticates to `hostname` by password, and returns the
+    SSH transport
+    """
+    with phase('t_connect', timings):
+        sock = socket.create_connection((hostname, port), timeout)
+    transport = paramiko.Transport(sock)
+    try:
+        with phase('t_kex', timings):
+            transport.start_client(timeout=timeout)
+            # start_client() returns without error when it times out
+            if transport.host_key is None:
+                raise paramiko.SSHException("timed out after {}s".format(timeout))
+        with phase('t_auth', timings):
+            transport.auth_password(username, password)
+    except SSHPhaseError:
+        transport.close()
+        raise
+    return transport
+
+
+def timing_perfdata(timings):
+    """
+    Returns the perfdata of the phases timed in `timings`
+    """
+    return ["{}={:.3f}s".format(name, timings[name]) for name in phases if name in timings]
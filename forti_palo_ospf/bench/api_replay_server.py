@@ -0,0 +1,185 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim: expandtab sw=4 ts=4:
+"""
+Minimal stand-in of firewall APIs, to test and benchmark the API backend of
+check_fw_ospf_routes.py without a firewall: serves recorded responses, or
+synthetic routing tables, over plain HTTP with keep-alive.
+Published under MIT license
+"""
+import argparse, json, os, sys, threading, time
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+    from urllib.parse import parse_qs, urlparse
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+    from urlparse import parse_qs, urlparse
+from xml.sax.saxutils import escape
+
+__author__ = 'Eric Belhomme'
+__contact__ = 'rico-github@ricozome.net'
+__license__ = 'MIT'
+
+
+paloFlags = ('A Oi', 'A Oo', 'A O1', 'A O2')
+fortiSubTypes = ('', 'IA', 'E1', 'E2', 'N1')
+
+
+def _prefix(n):
+    return "{}.{}.{}.0/24".format(10 + (n >> 16 & 63), n >> 8 & 255, n & 255)
+
+
+def panos_ospf_xml(count):
+    """
+    Returns a synthetic PAN-OS response to `show routing route type ospf`
+    """
+    entries = []
+    for n in range(count):
+        entries.append("<entry><virtual-router>default</virtual-router><destination>{}</destination>"
+            "<nexthop>172.16.{}.1</nexthop><metric>{}</metric><flags>{}</flags><age>{}</age>"
+            "<interface>ae1.{}</interface><route-table>unicast</route-table></entry>".format(
+            _prefix(n), n % 8, 10 + n % 50, paloFlags[n % len(paloFlags)], 100 + n % 86400, n % 4))
+    return ('<response status="success"><result><flags>flags: A:active, ?:loose, C:connect, H:host, '
+        'S:static, ~:internal, R:rip, O:ospf, B:bgp, Oi:ospf intra-area, Oo:ospf inter-area, '
+        'O1:ospf ext-type-1, O2:ospf ext-type-2, E:ecmp, M:multicast</flags>' + "".join(entries) +
+        '</result></response>').encode('utf-8')
+
+
+def fortios_routes_json(count, fields=None):
+    """
+    Returns a synthetic FortiOS `monitor/router/ipv4` response of `count`
+    OSPF routes, with only `fields` of results if set
+    """
+    results = []
+    now = int(time.time())
+    for n in range(count):
+        result = {'ip_version': 4, 'type': 'ospf', 'sub_type': fortiSubTypes[n % len(fortiSubTypes)],
+            'ip_mask': _prefix(n), 'distance': 110, 'metric': 10 + n % 50, 'priority': 0, 'vrf': 0,
+            'gateway': "172.16.{}.1".format(n % 8), 'non_rc_gateway': "172.16.{}.1".format(n % 8),
+            'interface': "port{}".format(n % 4 + 1), 'is_tunnel_route': False, 'tunnel_parent': '',
+            'install_date': now - 100 - n % 86400}
+        if fields:
+            result = dict((name, value) for name, value in result.items() if name in fields)
+        results.append(result)
+    return json.dumps({'http_method': 'GET', 'results': results, 'vdom': 'root', 'path': 'router',
+        'name': 'ipv4', 'action': '', 'status': 'success', 'serial': 'FGVM00BENCH', 'version': 'v6.4.0',
+        'build': 1579}, indent=2).encode('utf-8')
+
+
+def panos_error(code, text):
+    return '<response status="error" code="{}"><result><msg>{}</msg></result></response>'.format(code, escape(text)).encode('utf-8')
+
+
+class ApiHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            BaseHTTPRequestHandler.log_message(self, format, *args)
+
+    def send_body(self, status, body, content_type):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def params(self):
+        url = urlparse(self.path)
+        params = parse_qs(url.query)
+        length = int(self.headers.get('Content-Length') or 0)
+        if length:
+            params.update(parse_qs(self.rfile.read(length).decode('utf-8')))
+        return url.path, dict((name, values[0]) for name, values in params.items())
+
+    def do_GET(self):
+        with self.server.lock:
+            self.server.requests += 1
+        path, params = self.params()
+        if path == '/api/':
+            return self.panos(params)
+        if path == '/api/v2/monitor/router/ipv4':
+            return self.fortios_routes(params)
+        self.send_body(404, b'not found', 'text/plain')
+
+    do_POST = do_GET
+
+    def panos(self, params):
+        server = self.server
+        if params.get('type') == 'keygen':
+            if server.password is not None and params.get('password') != server.password:
+                return self.send_body(403, panos_error(403, 'Invalid Credential'), 'application/xml')
+            body = '<response status="success"><result><key>{}</key></result></response>'.format(server.key)
+            return self.send_body(200, body.encode('utf-8'), 'application/xml')
+        if (self.headers.get('X-PAN-KEY') or params.get('key')) != server.key:
+            return self.send_body(403, panos_error(403, 'Invalid Credential'), 'application/xml')
+        if params.get('type') == 'op' and 'ospf' in params.get('cmd', ''):
+            return self.send_body(200, server.response('panos_ospf.xml', panos_ospf_xml), 'application/xml')
+        self.send_body(200, panos_error(17, 'Invalid command'), 'application/xml')
+
+    def fortios_routes(self, params):
+        server = self.server
+        if self.headers.get('Authorization') != "Bearer {}".format(server.token):
+            body = {'http_method': 'GET', 'status': 'error', 'http_status': 401, 'error': 'Unauthorized'}
+            return self.send_body(401, json.dumps(body).encode('utf-8'), 'application/json')
+        fields = params.get('format')
+        response = server.response('fortios_routes.json',
+            lambda count: fortios_routes_json(count, fields.split('|') if fields else None), fields or '')
+        self.send_body(200, response, 'application/json')
+
+
+class ApiServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, options):
+        HTTPServer.__init__(self, address, ApiHandler)
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.key = options.key
+        self.token = options.token
+        self.password = options.password
+        self.routes = options.routes
+        self.responses = options.responses
+        self.verbose = options.verbose
+        self.cache = {}
+
+    def response(self, name, synthesize, variant=''):
+        """
+        Returns the recorded response `name` of `--responses` directory if
+        any, else a synthetic one of `--routes` routes (per `variant` of
+        request parameters)
+        """
+        with self.lock:
+            if (name, variant) not in self.cache:
+                path = os.path.join(self.responses, name) if self.responses else None
+                if path is not None and os.path.exists(path):
+                    with open(path, 'rb') as fd:
+                        self.cache[name, variant] = fd.read()
+                else:
+                    self.cache[name, variant] = synthesize(self.routes)
+            return self.cache[name, variant]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Stand-in of firewall APIs serving recorded or synthetic routing tables')
+    parser.add_argument('-l', '--listen', type=str, help='listen address', default='127.0.0.1')
+    parser.add_argument('-p', '--port', type=int, help='listen port', default=8080)
+    parser.add_argument('-d', '--responses', type=str, help='directory of recorded responses (panos_ospf.xml, fortios_routes.json)', default=None)
+    parser.add_argument('-r', '--routes', type=int, help='routes of synthetic responses', default=1000)
+    parser.add_argument('--key', type=str, help='PAN-OS API key', default='LUFRPT1bench')
+    parser.add_argument('--token', type=str, help='FortiOS API token', default='bench-token')
+    parser.add_argument('--password', type=str, help='password expected by key generation (any if not set)', default=None)
+    parser.add_argument('-v', '--verbose', help='log requests', action='store_true')
+    args = parser.parse_args()
+
+    server = ApiServer((args.listen, args.port), args)
+    sys.stderr.write("Serving on http://{}:{}\n".format(*server.server_address))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        sys.stderr.write("{} requests served\n".format(server.requests))
@@ -0,0 +1,187 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim: expandtab sw=4 ts=4:
+"""
+Benchmark of ospf_routes parsers over synthetic FortiOS and PAN-OS routing
+tables: reports for each parser its run time and the memory held by the
+parsed routes, against the former regex and dict based parsers.
+Published under MIT license
+"""
+import argparse, json, os, re, sys, time
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+benchDir = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(benchDir, '..'))
+import ospf_routes
+
+__author__ = 'Eric Belhomme'
+__contact__ = 'rico-github@ricozome.net'
+__license__ = 'MIT'
+
+
+fortiCodes = ('O      ', 'O IA   ', 'O E1   ', 'O E2   ', 'O N1   ')
+fortiAges = ('01:02:03', '2d03h', '1w2d', '00:00:42', '3w1d', '5h12m')
+paloFlags = ('A Oi  ', 'A Oo  ', 'A O1  ', 'A O2  ')
+
+
+def _prefix(n):
+    return "{}.{}.{}.0/24".format(10 + (n >> 16 & 63), n >> 8 & 255, n & 255)
+
+
+def fortinet_output(count, nexthops, interfaces):
+    """
+    Returns the lines of a `get router info routing-table ospf` output of
+    `count` routes
+    """
+    lines = ["Routing table for VRF=0\n"]
+    for n in range(count):
+        lines.append("{} {} [110/{}] via 172.16.{}.1, port{}, {}\n".format(fortiCodes[n % len(fortiCodes)],
+            _prefix(n), 10 + n % 50, n % nexthops, n % interfaces + 1, fortiAges[n % len(fortiAges)]))
+    lines.append("FW-1 $ ")
+    return lines
+
+
+def paloalto_output(count, nexthops, interfaces):
+    """
+    Returns the lines of a `show routing route type ospf` output of `count`
+    routes
+    """
+    lines = ["VIRTUAL ROUTER: default (id 1)\n", "  ==========\n",
+        "destination         nexthop         metric flags      age   interface          next-AS\n"]
+    for n in range(count):
+        lines.append("{:<19} {:<15} {:<6} {} {} ae1.{:<14}\n".format(_prefix(n), "172.16.{}.1".format(n % nexthops),
+            10 + n % 50, paloFlags[n % len(paloFlags)], 100 + n % 86400, n % interfaces))
+    lines.append("total routes shown: {}\n".format(count))
+    return lines
+
+
+def legacy_fortinet(lines):
+    """
+    Former regex based FortiOS parser of check_fw_ospf_routes.py, one dict
+    of strings per route
+    """
+    routes = []
+    reroute = re.compile(r'^O(\*|\s)(?P<flags>N1|E1|E2)?\s+(?P<dest>[\d{1,3}\.\/]+)\s+.*via\s(?P<hop>[0-9\.]+),\s+(?P<interface>.+),\s+(((?P<agew>\d+)w)?((?P<aged>\d+)d)?((?P<ageh>\d+)h)?((?P<agem>\d+)m)?((?P<age2h>\d+):(?P<age2m>\d+):\d+)?)\s*$')
+    for line in lines:
+        match = reroute.match(line)
+        if match:
+            age = 0
+            for group, seconds in (('agew', 7 * 86400), ('aged', 86400), ('ageh', 3600), ('age2h', 3600), ('agem', 60), ('age2m', 60)):
+                if match.group(group) is not None:
+                    age += int(match.group(group)) * seconds
+            flags = match.group('flags').strip().split(' ') if match.group('flags') is not None else []
+            routes.append({
+                'destination': match.group('dest'),
+                'gateway': match.group('hop'),
+                'metric': '0',
+                'flags': flags,
+                'age': str(age),
+                'interface': match.group('interface'),
+            })
+        if line.endswith('$'):
+            break
+    return routes
+
+
+def legacy_paloalto(lines):
+    """
+    Former regex based PAN-OS parser of check_fw_ospf_routes.py, one dict
+    of strings per route
+    """
+    routes = []
+    reroute = re.compile(r'^(?P<dest>[\d{1,3}\./]+)\s+(?P<hop>[\d{1,3}\.]+)\s+(?P<metric>\d+)\s+(?P<flags>[\?ACHS~ROBio12EM ]+)\s(?P<age>\d+)\s(?P<interface>[\w\d\.]+)\s*$')
+    for line in lines:
+        match = reroute.match(line)
+        if match:
+            routes.append({
+                'destination': match.group('dest'),
+                'gateway': match.group('hop'),
+                'metric': match.group('metric'),
+                'flags': match.group('flags').strip().split(' '),
+                'age': match.group('age'),
+                'interface': match.group('interface'),
+            })
+        if line.startswith('total'):
+            break
+    return routes
+
+
+benchParsers = {
+    'fortinet': (fortinet_output, (('ospf_routes', ospf_routes.parse_fortinet), ('legacy', legacy_fortinet))),
+    'paloalto': (paloalto_output, (('ospf_routes', ospf_routes.parse_paloalto), ('legacy', legacy_paloalto))),
+}
+
+
+def run_parser(parse, lines, runs):
+    """
+    Returns the routes count, best run time (s) and the memory held by the
+    routes (KiB, None without tracemalloc)
+    """
+    best = None
+    for run in range(runs):
+        start = time.time()
+        routes = parse(lines)
+        elapsed = time.time() - start
+        if best is None or elapsed < best:
+            best = elapsed
+        del routes
+    size = None
+    if tracemalloc is not None:
+        tracemalloc.start()
+        routes = parse(lines)
+        size = tracemalloc.get_traced_memory()[0] / 1024.0
+        tracemalloc.stop()
+    else:
+        routes = parse(lines)
+    return len(routes), best, size
+
+
+def bench(vendors, count, nexthops, interfaces, runs):
+    results = []
+    for vendor in vendors:
+        generate, parsers = benchParsers[vendor]
+        lines = generate(count, nexthops, interfaces)
+        for name, parse in parsers:
+            routes, elapsed, size = run_parser(parse, lines, runs)
+            results.append({
+                'vendor': vendor,
+                'parser': name,
+                'routes': routes,
+                'seconds': round(elapsed, 4),
+                'routes_per_s': int(routes / elapsed) if elapsed else None,
+                'memory_kb': round(size, 1) if size is not None else None,
+            })
+    return results
+
+
+def print_results(results):
+    print("{:<10} {:<12} {:>8} {:>9} {:>11} {:>12}".format('vendor', 'parser', 'routes', 'time (s)', 'routes/s', 'memory (MiB)'))
+    for r in results:
+        print("{:<10} {:<12} {:>8} {:>9.3f} {:>11} {:>12}".format(r['vendor'], r['parser'], r['routes'], r['seconds'],
+            r['routes_per_s'], "{:.1f}".format(r['memory_kb'] / 1024.0) if r['memory_kb'] is not None else '-'))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark OSPF routing table parsers over synthetic outputs')
+    parser.add_argument('-r', '--routes', type=int, help='routes in each table', default=100000)
+    parser.add_argument('--nexthops', type=int, help='distinct next hops', default=8)
+    parser.add_argument('--interfaces', type=int, help='distinct interfaces', default=4)
+    parser.add_argument('-v', '--vendors', type=str, help='comma-separated vendors ({})'.format(
+        ', '.join(sorted(benchParsers))), default='fortinet,paloalto')
+    parser.add_argument('-n', '--runs', type=int, help='runs per parser (best is reported)', default=3)
+    parser.add_argument('--json', type=str, help='also write results to this JSON file', default=None)
+    args = parser.parse_args()
+
+    vendors = args.vendors.split(',')
+    for vendor in vendors:
+        if vendor not in benchParsers:
+            parser.error("unknown vendor '{}'".format(vendor))
+
+    results = bench(vendors, args.routes, args.nexthops, args.interfaces, args.runs)
+    print_results(results)
+    if args.json:
+        with open(args.json, 'w') as fd:
+            json.dump({'routes': args.routes, 'results': results}, fd, indent=2)
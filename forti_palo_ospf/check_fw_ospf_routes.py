@@ -7,138 +7,308 @@ Retrieve the number of OSPF routes on Palto Alto firewalls throught CLI by SSH
 Published under MIT license
 """
 
-import argparse, paramiko, netsnmp
+import argparse, fcntl, os, socket, time
+from xml.etree import ElementTree
+import ospf_routes, ssh_phases
 from pprint import pprint
 
 __author__ = 'Eric Belhomme'
 __contact__ = 'rico-github@ricozome.net'
 __license__ = 'MIT'
 
+panosOspfCommand = '<show><routing><route><type>ospf</type></route></routing></show>'
+# FortiOS routing table monitor, filtered on OSPF routes and their used fields
+fortiRoutesPath = '/api/v2/monitor/router/ipv4'
+fortiRoutesParams = {'type': 'ospf', 'format': 'type|sub_type|ip_mask|gateway|interface|metric|install_date'}
+
+# duration (s) of the phases of the SSH session
+timings = {}
+
+
+def timing_perfdata():
+    """
+    Returns the perfdata of the SSH phases timed so far, with `--timing`
+    """
+    if not args.timing:
+        return []
+    return ssh_phases.timing_perfdata(timings)
+
+
+def ssh_connect(fwServer, fwUser, fwPasswd):
+    """
+    Connects and authenticates to the firewall, and returns the SSH transport
+    """
+    return ssh_phases.connect(fwServer, fwUser, fwPasswd, args.timeout, timings, args.port)
+
+
+def ssh_exec(transport, command, stdin=None):
+    """
+    Runs `command` on a new channel of `transport`, writes `stdin` to it if
+    given, and returns the channel output as a file
+    """
+    with ssh_phases.phase('t_exec', timings):
+        channel = transport.open_session(timeout=args.timeout)
+        channel.settimeout(args.timeout)
+        channel.exec_command(command)
+        if stdin is not None:
+            channel.sendall(stdin)
+    return channel.makefile('r')
+
+
+def read_lines(stdout):
+    """
+    Yields the lines of a channel output, timing them in `timings`
+    """
+    start = time.time()
+    try:
+        for line in stdout:
+            yield line
+    except ssh_phases.sshErrors as e:
+        raise ssh_phases.SSHReadError(e)
+    finally:
+        timings['t_read'] = time.time() - start
+
+
 def getPaltoAltoRoutes(fwServer, fwUser, fwPasswd):
-    # dFlags = {
-    #     'A': 'active',
-    #     '?': 'loose',
-    #     'C': 'connect',
-    #     'H': 'host',
-    #     'S': 'static',
-    #     '~': 'internal',
-    #     'R': 'rip',
-    #     'O': 'ospf',
-    #     'B': 'bgp',
-    #     'Oi': 'ospf intra-area',
-    #     'Oo': 'ospf inter-area',
-    #     'O1': 'ospf ext-type-1',
-    #     'O2': 'ospf ext-type-2',
-    #     'E': 'ecmp',
-    #     'M': 'multicast',
-    # }
-    
-    routes = []
-    reroute = re.compile('^(?P<dest>[\d{1,3}\./]+)\s+(?P<hop>[\d{1,3}\.]+)\s+(?P<metric>\d+)\s+(?P<flags>[\?ACHS~ROBio12EM ]+)\s(?P<age>\d+)\s(?P<interface>[\w\d\.]+)\s*$')
-    ssh = paramiko.SSHClient()
-    ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-    ssh.connect( fwServer, username=fwUser, password=fwPasswd)
-    stdin, stdout, stderr = ssh.exec_command("")
-    
-    stdin.write("show routing route type ospf\n")
-    stdin.flush()
-    
-    line = stdout.next()
-    while line:
-        match = reroute.match(line)
-        if match:
-            routes.append(
-                {
-                    'destination': match.group('dest'),
-                    'gateway': match.group('hop'),
-                    'metric': match.group('metric'),
-                    'flags': match.group('flags').strip().rstrip().split(' '),
-                    'age':  match.group('age'),
-                    'interface': match.group('interface'),
-                }
-            )
-        if line.startswith('total'):
-            break
-        line = stdout.next()
-    ssh.close()
-    return routes
+    transport = ssh_connect(fwServer, fwUser, fwPasswd)
+    try:
+        stdout = ssh_exec(transport, "", "show routing route type ospf\n")
+        return ospf_routes.parse_paloalto(read_lines(stdout))
+    finally:
+        transport.close()
 
 
-def getFortinetRoutes(fwServer, fwUser, fwPasswd):
-    routes = []
-    # reroute = re.compile('^O(\*|\s)(?P<flags>N1|E1|E2)?\s+(?P<dest>[\d{1,3}\.\/]+)\s+.*via\s(?P<hop>[0-9\.]+),\s+(?P<interface>.+),\s+((?P<agew>\d+)w)?((?P<aged>\d+)d)?((?P<ageh>\d+)h)?((?P<agem>\d+)m)?\s*$')
-    reroute = re.compile('^O(\*|\s)(?P<flags>N1|E1|E2)?\s+(?P<dest>[\d{1,3}\.\/]+)\s+.*via\s(?P<hop>[0-9\.]+),\s+(?P<interface>.+),\s+(((?P<agew>\d+)w)?((?P<aged>\d+)d)?((?P<ageh>\d+)h)?((?P<agem>\d+)m)?((?P<age2h>\d+):(?P<age2m>\d+):\d+)?)\s*$')
-    ssh = paramiko.SSHClient()
-    ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-    ssh.connect( fwServer, username=fwUser, password=fwPasswd)
-    stdin, stdout, stderr = ssh.exec_command("get router info routing-table ospf")
-    
-#    stdin.write("get router info routing-table ospf\n")
-#    stdin.flush()
-    
-    line = stdout.next()
-    while line:
-        match = reroute.match(line)
-        if match:
-            age = 0
-            if match.group('agew') > 0:
-                age += int(match.group('agew')) * 7 * 86400
-            if match.group('aged') > 0:
-                age += int(match.group('aged')) * 86400
-            if match.group('ageh') > 0:
-                age += int(match.group('ageh')) * 3600
-            if match.group('age2h') > 0:
-                age += int(match.group('age2h')) * 3600
-            if match.group('agem') > 0:
-                age += int(match.group('agem')) * 60
-            if match.group('age2m') > 0:
-                age += int(match.group('age2m')) * 60
-
-            if match.group('flags') > 0:
-                flags = match.group('flags').strip().rstrip().split(' ')
-            else:
-                flags =[]
-            routes.append(
-                {
-                    'destination': match.group('dest'),
-                    'gateway': match.group('hop'),
-                    'metric': '0',
-                    'flags': flags,
-                    'age': str(age),
-                    'interface': match.group('interface'),
-                }
-            )
-        if line.endswith('$'):
-            break
+def open_api_session():
+    """
+    Returns a keep-alive HTTPS session to the firewall API
+    """
+    import requests
+    requests.packages.urllib3.disable_warnings(requests.packages.urllib3.exceptions.InsecureRequestWarning)
+    session = requests.Session()
+    session.verify = False
+    return session
+
+
+def _api_base(fwServer):
+    return (args.api_url or "https://{}".format(fwServer)).rstrip('/')
+
+
+def _panos_key(session, fwServer, fwUser, fwPasswd, renew=False):
+    """
+    Returns the PAN-OS API key of `fwUser`, from the key file of
+    `--state-dir`, or generated by the API (then stored) if missing or
+    `renew` is set
+    """
+    path = os.path.join(args.state_dir, "{}.apikey".format(fwServer))
+    if not renew:
+        try:
+            with open(path) as fd:
+                user, key = fd.read().split(None, 1)
+            if user == fwUser:
+                return key.strip()
+        except (IOError, OSError, ValueError):
+            pass
+    response = session.post(_api_base(fwServer) + '/api/', timeout=args.timeout,
+        data={'type': 'keygen', 'user': fwUser, 'password': fwPasswd})
+    try:
+        root = ElementTree.fromstring(response.content)
+    except ElementTree.ParseError as e:
+        response.raise_for_status()
+        raise ospf_routes.ApiError(None, "invalid keygen response: {}".format(e))
+    key = root.findtext('result/key')
+    if root.get('status') != 'success' or not key:
+        raise ospf_routes.ApiError(root.get('code'), " ".join("".join(root.itertext()).split()) or 'API key generation failed')
+    try:
+        if not os.path.isdir(args.state_dir):
+            os.makedirs(args.state_dir)
+        # the key grants API access: keep it private
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
         try:
-            line = stdout.next()
-        except StopIteration:
-            break;        
+            os.write(fd, "{} {}\n".format(fwUser, key).encode('utf-8'))
+        finally:
+            os.close(fd)
+    except (IOError, OSError):
+        pass
+    return key
+
 
-    ssh.close()
-    return routes
+def _panos_op(session, fwServer, key):
+    response = session.get(_api_base(fwServer) + '/api/', timeout=args.timeout, stream=True,
+        params={'type': 'op', 'cmd': panosOspfCommand}, headers={'X-PAN-KEY': key})
+    try:
+        if response.status_code == 403:
+            raise ospf_routes.ApiError('403', 'API key rejected')
+        response.raise_for_status()
+        response.raw.decode_content = True
+        return ospf_routes.parse_paloalto_xml(response.raw)
+    finally:
+        response.close()
+
+
+def getPaloAltoApiRoutes(fwServer, fwUser, fwPasswd):
+    """
+    Runs `show routing route type ospf` through the PAN-OS XML API, and parses
+    the response as it is received. The API key is cached, and generated
+    again once if the firewall rejects it.
+    """
+    session = open_api_session()
+    try:
+        key = _panos_key(session, fwServer, fwUser, fwPasswd)
+        try:
+            return _panos_op(session, fwServer, key)
+        except ospf_routes.ApiError as e:
+            if e.code != '403':
+                raise
+        # the cached key was revoked, or its user password changed
+        key = _panos_key(session, fwServer, fwUser, fwPasswd, renew=True)
+        return _panos_op(session, fwServer, key)
+    finally:
+        session.close()
+
+
+def getFortinetApiRoutes(fwServer, fwUser, fwPasswd):
+    """
+    Reads the OSPF routes of the FortiOS routing table monitor through the
+    REST API, authenticated by the API token of a REST API administrator
+    given as password, and parses the response as it is received.
+    """
+    session = open_api_session()
+    session.headers['Authorization'] = "Bearer {}".format(fwPasswd)
+    try:
+        response = session.get(_api_base(fwServer) + fortiRoutesPath, timeout=args.timeout, stream=True,
+            params=fortiRoutesParams)
+        try:
+            if response.status_code in (401, 403):
+                raise ospf_routes.ApiError(str(response.status_code), 'API token rejected')
+            response.raise_for_status()
+            response.raw.decode_content = True
+            return ospf_routes.parse_fortinet_json(response.raw, time.time())
+        finally:
+            response.close()
+    finally:
+        session.close()
+
+
+def getFortinetRoutes(fwServer, fwUser, fwPasswd):
+    transport = ssh_connect(fwServer, fwUser, fwPasswd)
+    try:
+        stdout = ssh_exec(transport, "get router info routing-table ospf")
+        return ospf_routes.parse_fortinet(read_lines(stdout))
+    finally:
+        transport.close()
+
+
+def perf_label(label):
+    """
+    Quotes perfdata `label` when it holds spaces, quotes or `=`
+    """
+    if any(char in label for char in " '="):
+        return "'{}'".format(label.replace("'", "''"))
+    return label
+
+
+def diff_routes(routes):
+    """
+    Compares `routes` with the snapshot stored on previous run in the
+    per-firewall snapshot file of `--state-dir`, then stores them in place of
+    it. Returns the (added, withdrawn, flapped) routes lists, or None on
+    first run.
+    """
+    now = time.time()
+    path = os.path.join(args.state_dir, "{}.routes".format(args.hostname))
+    records = ospf_routes.snapshot(routes)
+    if not os.path.isdir(args.state_dir):
+        os.makedirs(args.state_dir)
+    with open(path, 'a+b') as fd:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        fd.seek(0)
+        previous, stamp = ospf_routes.read_snapshot(fd)
+        fd.seek(0)
+        fd.truncate()
+        ospf_routes.write_snapshot(fd, records, now)
+        fcntl.flock(fd, fcntl.LOCK_UN)
+    if previous is None:
+        return None
+    return ospf_routes.diff_snapshots(previous, records, now - stamp)
+
+
+def load_required(path):
+    """
+    Loads the required prefixes file `path`, one prefix (eg. `10.1.0.0/16`)
+    per line, into a PrefixTrie
+    """
+    trie = ospf_routes.PrefixTrie()
+    with open(path) as fd:
+        for lineno, line in enumerate(fd, 1):
+            line = line.split('#', 1)[0].strip()
+            if not line:
+                continue
+            try:
+                address, masklen = line.split('/') if '/' in line else (line, '32')
+                masklen = int(masklen)
+                if not 0 <= masklen <= 32:
+                    raise ValueError()
+                trie.insert(ospf_routes.ip_to_int(address), masklen)
+            except (ValueError, socket.error):
+                raise ValueError("{}:{}: invalid prefix '{}'".format(path, lineno, line))
+    return trie
 
 
 parser = argparse.ArgumentParser(description='Nagios check for OSPF routes count, for Fortinet and PaloAlto firewalls')
 parser.add_argument('-H', '--hostname', type=str, help='hostname or IP address', required=True)
+parser.add_argument('--port', type=int, help='SSH port', default=22)
 parser.add_argument('-U', '--username', type=str, help='username', required=True)
-parser.add_argument('-P', '--password', type=str, help='user password', required=True)
+parser.add_argument('-P', '--password', type=str, help='user password (API token with FortiOS API)', required=True)
 parser.add_argument('-t', '--type', type=str, help='FW type (Palo, Forti)', choices=['paloalto', 'fortinet'], required=True)
 parser.add_argument('-p', '--perfdata', help='enable pnp4nagios perfdata', action='store_true')
 parser.add_argument('-w', '--warning', type=int, nargs='?', help='warning trigger', default=10)
 parser.add_argument('-c', '--critical', type=int, nargs='?', help='critical trigger', default=6)
+parser.add_argument('-b', '--backend', type=str, help='routes retrieval backend: CLI by SSH, or firewall API', choices=['ssh', 'api'], default='ssh')
+parser.add_argument('--api-url', type=str, help='firewall API base URL (defaults to https://<hostname>)', default=None)
+parser.add_argument('--timeout', type=int, help='SSH phases and API requests timeout in seconds', default=30)
+parser.add_argument('--timing', help='add the duration of SSH session phases to perfdata', action='store_true')
+parser.add_argument('--required', type=str, help='file of prefixes that must be covered by OSPF routes', default=None)
+parser.add_argument('--required-lines', type=int, help='maximum number of uncovered prefixes listed', default=10)
+parser.add_argument('--diff', help='report routes added, withdrawn and flapped since previous run', action='store_true')
+parser.add_argument('--diff-lines', type=int, help='maximum number of routes listed per change kind', default=10)
+parser.add_argument('--summary-lines', type=int, help='maximum number of types, interfaces and next hops listed', default=10)
+parser.add_argument('--list', help='list the routes', action='store_true')
+parser.add_argument('--list-lines', type=int, help='maximum number of routes listed', default=50)
+parser.add_argument('--state-dir', type=str, help='directory of the routes snapshot and API key files', default='/var/tmp/check_fw_ospf_routes')
 
 args = parser.parse_args()
 
+required = None
+if args.required is not None:
+    try:
+        required = load_required(args.required)
+    except (IOError, ValueError) as e:
+        parser.error(str(e))
+
 
 retcode = 0
 message = "OK: "
 
 routes = []
-if args.type.startswith('paloalto'):
-    routes = getPaltoAltoRoutes(args.hostname, args.username, args.password)
-elif args.type.startswith('fortinet'):
-    routes = getFortinetRoutes(args.hostname, args.username, args.password)
+try:
+    if args.type.startswith('paloalto') and args.backend == 'api':
+        routes = getPaloAltoApiRoutes(args.hostname, args.username, args.password)
+    elif args.type.startswith('paloalto'):
+        routes = getPaltoAltoRoutes(args.hostname, args.username, args.password)
+    elif args.type.startswith('fortinet') and args.backend == 'api':
+        routes = getFortinetApiRoutes(args.hostname, args.username, args.password)
+    elif args.type.startswith('fortinet'):
+        routes = getFortinetRoutes(args.hostname, args.username, args.password)
+except ssh_phases.SSHPhaseError as e:
+    message = "UNKNOWN: {} (on {} as user '{}')\n".format(e, args.hostname, args.username)
+    if timing_perfdata():
+        message += "| {}".format(" ".join(timing_perfdata()))
+    print(message)
+    exit(3)
+except (IOError, ValueError, ospf_routes.ApiError) as e:
+    # requests exceptions derive from IOError
+    print("UNKNOWN: API request to {} failed: {}".format(args.hostname, e))
+    exit(3)
 
 if len(routes) <= args.warning:
     retcode = 1
@@ -147,15 +317,78 @@ if len(routes) <= args.critical:
     retcode = 2
     message = "CRITICAL: "
 
+uncovered = None
+if required is not None:
+    required.match(routes)
+    uncovered = required.uncovered()
+    if uncovered:
+        retcode = 2
+        message = "CRITICAL: "
+
 if len(routes) == 0:
-    message += "{} no active routes found.\n"
+    message += "no active routes found"
 else:
-    message += "{} active routes found :\n".format(len(routes))
-    for route in routes:
-        message += "dest. {} via {}\n".format(route['destination'], route['gateway'])
+    message += "{} active routes found".format(len(routes))
+
+# output lines are joined once: the long output may list many routes
+lines = []
+if uncovered:
+    lines.append("{} of {} required prefixes not covered by OSPF routes".format(len(uncovered), required.count))
+    for prefix, masklen in uncovered[:args.required_lines]:
+        lines.append("uncovered: {}/{}".format(ospf_routes.int_to_ip(prefix), masklen))
+    if len(uncovered) > args.required_lines:
+        lines.append("uncovered: ... {} more".format(len(uncovered) - args.required_lines))
+elif uncovered is not None:
+    lines.append("all {} required prefixes covered by OSPF routes".format(required.count))
+
+changes = None
+if args.diff:
+    try:
+        changes = diff_routes(routes)
+    except (IOError, OSError) as e:
+        lines.append("Unable to store routes snapshot: {}".format(e))
+if changes is not None:
+    lines.append("{} added, {} withdrawn, {} flapped since previous run".format(*[len(change) for change in changes]))
+    for kind, change in zip(('added', 'withdrawn', 'flapped'), changes):
+        for record in change[:args.diff_lines]:
+            lines.append("{}: {}".format(kind, ospf_routes.record_text(*record)))
+        if len(change) > args.diff_lines:
+            lines.append("{}: ... {} more".format(kind, len(change) - args.diff_lines))
+
+summary = []
+byKind, byInterface, byNexthop = ospf_routes.aggregate(routes)
+for title, stats, names in (
+        ('type', byKind, lambda kind: kind or 'other'),
+        ('interface', byInterface, lambda interface: interface or '-'),
+        ('next hop', byNexthop, ospf_routes.int_to_ip)):
+    # most used first, so that the listing cut only drops the least used
+    ranked = sorted(stats.items(), key=lambda item: (-item[1][0], names(item[0])))
+    for key, (count, minAge, maxAge, totalAge) in ranked[:args.summary_lines]:
+        lines.append("{} {}: {} routes, age min {}s avg {}s max {}s".format(title, names(key), count, minAge,
+            totalAge // count, maxAge))
+    if len(ranked) > args.summary_lines:
+        lines.append("{}: ... {} more".format(title, len(ranked) - args.summary_lines))
+    prefix = title.replace(' ', '')
+    for key, (count, minAge, maxAge, totalAge) in ranked:
+        summary.append(perf_label("routes_{}_{}".format(prefix, names(key))) + "={}".format(count))
+        summary.append(perf_label("age_{}_{}".format(prefix, names(key))) + "={}s".format(totalAge // count))
+
+if args.list:
+    for route in routes[:args.list_lines]:
+        lines.append("dest. {} via {}".format(route.destination, route.gateway))
+    if len(routes) > args.list_lines:
+        lines.append("dest. ... {} more".format(len(routes) - args.list_lines))
 
+perfdata = timing_perfdata()
 if args.perfdata:
-    message += "| routes={};{};{}".format(len(routes), args.warning, args.critical)
+    perfdata[0:0] = summary
+    perfdata.insert(0, "routes={};{};{}".format(len(routes), args.warning, args.critical))
+    if uncovered is not None:
+        perfdata.insert(1, "required_uncovered={};;1".format(len(uncovered)))
+    if changes is not None:
+        perfdata[1:1] = ["routes_{}={}".format(kind, len(change)) for kind, change in zip(('added', 'withdrawn', 'flapped'), changes)]
+if perfdata:
+    lines.append("| {}".format(" ".join(perfdata)))
 
-print(message)
+print("\n".join([message] + lines))
 exit(retcode)
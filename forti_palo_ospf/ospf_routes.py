@@ -0,0 +1,576 @@
+# -*- coding: utf-8 -*-
+# vim: expandtab sw=4 ts=4:
+"""
+OSPF routing table parsers of check_fw_ospf_routes.py: FortiOS and PAN-OS CLI
+outputs are read line by line, and API responses as they are received, in a
+single pass, into compact route records.
+Published under MIT license
+"""
+
+import array, codecs, json, re, socket, struct
+from xml.etree import ElementTree
+
+__author__ = 'Eric Belhomme'
+__contact__ = 'rico-github@ricozome.net'
+__license__ = 'MIT'
+
+# OSPF route types
+routeKinds = ('intra', 'inter', 'ext1', 'ext2', 'nssa1', 'nssa2')
+
+# FortiOS route codes (after `O`) and PAN-OS flags -> route type
+fortiKinds = {'': 'intra', 'IA': 'inter', 'E1': 'ext1', 'E2': 'ext2', 'N1': 'nssa1', 'N2': 'nssa2'}
+paloKinds = {'Oi': 'intra', 'Oo': 'inter', 'O1': 'ext1', 'O2': 'ext2'}
+
+# FortiOS age units, in seconds
+ageUnits = {'w': 7 * 86400, 'd': 86400, 'h': 3600, 'm': 60, 's': 1}
+
+
+class ApiError(Exception):
+    """
+    Error reported by a firewall API, with its `code` if any
+    """
+
+    def __init__(self, code, text):
+        Exception.__init__(self, "{} (code {})".format(text, code) if code else text)
+        self.code = code
+
+
+class Route(object):
+    """
+    OSPF route: destination prefix and next hop as 32 bits integers, metric,
+    type (from `routeKinds`, None when not reported), age in seconds, and
+    interface name. Interface names are shared between the routes of a table.
+    """
+    __slots__ = ('prefix', 'masklen', 'nexthop', 'metric', 'kind', 'age', 'interface')
+
+    def __init__(self, prefix, masklen, nexthop, metric, kind, age, interface):
+        self.prefix = prefix
+        self.masklen = masklen
+        self.nexthop = nexthop
+        self.metric = metric
+        self.kind = kind
+        self.age = age
+        self.interface = interface
+
+    @property
+    def destination(self):
+        return "{}/{}".format(int_to_ip(self.prefix), self.masklen)
+
+    @property
+    def gateway(self):
+        return int_to_ip(self.nexthop)
+
+    def __repr__(self):
+        return "Route({} via {} dev {}, {}, metric {}, age {}s)".format(
+            self.destination, self.gateway, self.interface, self.kind, self.metric, self.age)
+
+
+_ip = struct.Struct('!I')
+
+
+def ip_to_int(address):
+    return _ip.unpack(socket.inet_aton(address))[0]
+
+
+def int_to_ip(value):
+    return socket.inet_ntoa(_ip.pack(value))
+
+
+def fortinet_age(text):
+    """
+    Converts a FortiOS route age (`01:02:03`, `2d03h`, `1w2d`...) to seconds
+    """
+    if ':' in text:
+        hours, minutes, seconds = text.split(':')
+        return int(hours) * 3600 + int(minutes) * 60 + int(seconds)
+    age = 0
+    value = 0
+    for char in text:
+        if char.isdigit():
+            value = value * 10 + ord(char) - 48
+        else:
+            age += value * ageUnits[char]
+            value = 0
+    return age
+
+
+def parse_fortinet(lines):
+    """
+    Parses `get router info routing-table ospf` output lines, up to the CLI
+    prompt, and returns the list of routes. Lines look like:
+
+        O E2    10.2.0.0/16 [110/20] via 10.0.0.3, port2, 2d03h
+
+    ECMP continuation lines (without `O` code) are not counted as routes.
+    """
+    # next hops, interfaces and ages repeat across routes: they are converted
+    # once, and interface names are shared
+    nexthops = {}
+    interfaces = {}
+    ages = {}
+    aton = socket.inet_aton
+    unpack = _ip.unpack
+    routes = []
+    append = routes.append
+    for line in lines:
+        if line[:1] != 'O':
+            if line.rstrip().endswith('$'):
+                break
+            continue
+        via = line.find(' via ')
+        if via < 0:
+            continue
+        head = line[:via].split()
+        # `O`, `O*`, `O E2`, `O*E2` or `O IA`, then destination and [distance/metric]
+        if len(head) == 4:
+            kind = fortiKinds.get(head[1])
+        elif len(head) == 3:
+            kind = fortiKinds.get(head[0][2:] if head[0][:2] == 'O*' else head[0][1:])
+        else:
+            continue
+        if kind is None:
+            continue
+        fields = line[via + 5:].rstrip().split(', ')
+        if len(fields) < 3:
+            continue
+        try:
+            address, masklen = head[-2].split('/')
+            nexthop = nexthops.get(fields[0])
+            if nexthop is None:
+                nexthop = nexthops[fields[0]] = unpack(aton(fields[0]))[0]
+            age = ages.get(fields[-1])
+            if age is None:
+                age = ages[fields[-1]] = fortinet_age(fields[-1])
+            interface = ', '.join(fields[1:-1]) if len(fields) > 3 else fields[1]
+            append(Route(unpack(aton(address))[0], int(masklen), nexthop, int(head[-1][1:-1].split('/')[1]),
+                kind, age, interfaces.setdefault(interface, interface)))
+        except (ValueError, IndexError, KeyError, socket.error):
+            continue
+    return routes
+
+
+def parse_paloalto(lines):
+    """
+    Parses `show routing route type ospf` output lines, up to the `total`
+    line, and returns the list of routes. Lines look like:
+
+        10.1.0.0/24     10.0.0.2     20     A Oi     3600 ethernet1/1
+    """
+    # next hops and interfaces repeat across routes: they are converted once,
+    # and interface names are shared
+    nexthops = {}
+    interfaces = {}
+    aton = socket.inet_aton
+    unpack = _ip.unpack
+    routes = []
+    append = routes.append
+    for line in lines:
+        if not line[:1].isdigit():
+            if line.startswith('total'):
+                break
+            continue
+        fields = line.split()
+        count = len(fields)
+        if count < 6:
+            continue
+        # flags are one or more words, up to the age
+        pos = 3
+        kind = None
+        while pos < count and not fields[pos].isdigit():
+            kind = paloKinds.get(fields[pos], kind)
+            pos += 1
+        if kind is None or pos + 1 >= count:
+            continue
+        try:
+            address, masklen = fields[0].split('/')
+            nexthop = nexthops.get(fields[1])
+            if nexthop is None:
+                nexthop = nexthops[fields[1]] = unpack(aton(fields[1]))[0]
+            interface = fields[pos + 1]
+            append(Route(unpack(aton(address))[0], int(masklen), nexthop, int(fields[2]),
+                kind, int(fields[pos]), interfaces.setdefault(interface, interface)))
+        except (ValueError, socket.error):
+            continue
+    return routes
+
+
+def parse_paloalto_xml(source):
+    """
+    Parses the PAN-OS XML API response to `show routing route type ospf`,
+    read incrementally from the `source` file object, and returns the list of
+    routes. Each `<entry>` element is turned into a route and dropped as soon
+    as it is parsed, so that the document is never held in memory. Raises
+    ApiError if the API reports an error.
+    """
+    routes = []
+    nexthops = {}
+    interfaces = {}
+    append = routes.append
+    status = code = result = None
+    messages = []
+    try:
+        for event, elem in ElementTree.iterparse(source, events=('start', 'end')):
+            if event == 'start':
+                if status is None:
+                    status, code = elem.get('status', ''), elem.get('code')
+                elif result is None:
+                    result = elem
+                continue
+            if elem.tag != 'entry':
+                if status != 'success' and elem.text and elem.text.strip():
+                    messages.append(elem.text.strip())
+                continue
+            kind = None
+            for flag in (elem.findtext('flags') or '').split():
+                kind = paloKinds.get(flag, kind)
+            if kind is not None:
+                try:
+                    address, masklen = elem.findtext('destination').split('/')
+                    gateway = elem.findtext('nexthop')
+                    nexthop = nexthops.get(gateway)
+                    if nexthop is None:
+                        nexthop = nexthops[gateway] = ip_to_int(gateway)
+                    interface = elem.findtext('interface') or ''
+                    append(Route(ip_to_int(address), int(masklen), nexthop, int(elem.findtext('metric') or 0),
+                        kind, int(elem.findtext('age') or 0), interfaces.setdefault(interface, interface)))
+                except (AttributeError, ValueError, socket.error):
+                    pass
+            result.clear()
+    except ElementTree.ParseError as e:
+        raise ApiError(None, "invalid XML response: {}".format(e))
+    if status != 'success':
+        raise ApiError(code, " ".join(messages) or 'API request failed')
+    return routes
+
+
+class _JsonReader(object):
+    """
+    Reads the JSON document of a file object value by value, so that the
+    items of a large array are decoded as they are received
+    """
+    blanks = re.compile(r'[ \t\r\n]*')
+
+    def __init__(self, source, chunk):
+        self.source = source
+        self.chunk = chunk
+        self.decoder = json.JSONDecoder()
+        self.utf8 = codecs.getincrementaldecoder('utf-8')()
+        self.buffer = ''
+        self.pos = 0
+        self.eof = False
+
+    def fill(self):
+        data = self.source.read(self.chunk)
+        self.eof = not data
+        self.buffer = self.buffer[self.pos:] + self.utf8.decode(data or b'', self.eof)
+        self.pos = 0
+
+    def peek(self):
+        """
+        Returns the next non-blank character, or '' at end of document
+        """
+        while True:
+            self.pos = self.blanks.match(self.buffer, self.pos).end()
+            if self.pos < len(self.buffer) or self.eof:
+                return self.buffer[self.pos:self.pos + 1]
+            self.fill()
+
+    def expect(self, chars):
+        char = self.peek()
+        if not char or char not in chars:
+            raise ValueError("expected '{}' instead of '{}'".format("' or '".join(chars), char))
+        self.pos += 1
+        return char
+
+    def value(self):
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+                # a number at the end of the buffer may continue in next chunk
+                if end < len(self.buffer) or self.eof:
+                    self.pos = end
+                    return value
+            except ValueError:
+                if self.eof:
+                    raise
+            self.fill()
+
+    def items(self, start, stop):
+        """
+        Iterates over the items of the object or array starting here, which
+        the caller reads on each iteration
+        """
+        self.expect(start)
+        if self.peek() == stop:
+            self.pos += 1
+            return
+        while True:
+            yield
+            if self.expect(',' + stop) == stop:
+                return
+
+
+def parse_fortinet_json(source, now, chunk=65536):
+    """
+    Parses the FortiOS REST API response of the `monitor/router/ipv4`
+    routing table, read incrementally from the `source` file object, and
+    returns the list of OSPF routes. Route ages are computed from their
+    install date and `now`. Results look like:
+
+        {"type": "ospf", "ip_mask": "10.2.0.0/16", "gateway": "10.0.0.3",
+         "interface": "port2", "metric": 20, "install_date": 1539000000}
+
+    Raises ApiError if the API reports an error.
+    """
+    reader = _JsonReader(source, chunk)
+    nexthops = {}
+    interfaces = {}
+    routes = []
+    append = routes.append
+    envelope = {}
+    for member in reader.items('{', '}'):
+        name = reader.value()
+        reader.expect(':')
+        if name != 'results' or reader.peek() != '[':
+            envelope[name] = reader.value()
+            continue
+        for item in reader.items('[', ']'):
+            entry = reader.value()
+            try:
+                if entry.get('type', 'ospf') != 'ospf':
+                    continue
+                address, masklen = entry['ip_mask'].split('/')
+                gateway = entry.get('gateway') or '0.0.0.0'
+                nexthop = nexthops.get(gateway)
+                if nexthop is None:
+                    nexthop = nexthops[gateway] = ip_to_int(gateway)
+                interface = entry.get('interface') or ''
+                # not all FortiOS versions report the OSPF route type, and
+                # intra-area routes have an empty one
+                sub_type = entry.get('sub_type')
+                kind = fortiKinds.get(sub_type) if sub_type is not None else None
+                install = entry.get('install_date')
+                age = max(0, int(now - install)) if install else 0
+                append(Route(ip_to_int(address), int(masklen), nexthop, int(entry.get('metric') or 0),
+                    kind, age, interfaces.setdefault(interface, interface)))
+            except (AttributeError, KeyError, TypeError, ValueError, socket.error):
+                continue
+    if envelope.get('status', 'success') != 'success':
+        raise ApiError(envelope.get('http_status'), envelope.get('error') or envelope.get('status'))
+    return routes
+
+
+def aggregate(routes):
+    """
+    Counts routes per type, interface and next hop, in a single pass, along
+    with their ages. Returns three dicts (by type, by interface and by next
+    hop) of [count, min age, max age, total age] lists.
+    """
+    # routes are first grouped by (type, interface, next hop), which are few,
+    # then groups are folded into each aggregate
+    groups = {}
+    get = groups.get
+    for route in routes:
+        key = (route.kind, route.interface, route.nexthop)
+        age = route.age
+        stats = get(key)
+        if stats is None:
+            groups[key] = [1, age, age, age]
+            continue
+        stats[0] += 1
+        if age < stats[1]:
+            stats[1] = age
+        elif age > stats[2]:
+            stats[2] = age
+        stats[3] += age
+    aggregates = ({}, {}, {})
+    for key, stats in groups.items():
+        for aggregate, name in zip(aggregates, key):
+            total = aggregate.get(name)
+            if total is None:
+                aggregate[name] = list(stats)
+            else:
+                total[0] += stats[0]
+                total[1] = min(total[1], stats[1])
+                total[2] = max(total[2], stats[2])
+                total[3] += stats[3]
+    return aggregates
+
+
+def snapshot(routes):
+    """
+    Returns the snapshot of a routing table: a flat array of (prefix,
+    masklen, next hop, age) records, sorted by prefix, masklen and next hop
+    """
+    records = sorted(((route.prefix << 38) | (route.masklen << 32) | route.nexthop, route.age) for route in routes)
+    flat = array.array('I')
+    for key, age in records:
+        flat.extend((key >> 38, key >> 32 & 63, key & 0xffffffff, age))
+    return flat
+
+
+def write_snapshot(fd, records, stamp):
+    """
+    Writes a snapshot file: its timestamp, its records count, then records
+    """
+    array.array('d', [stamp]).tofile(fd)
+    array.array('I', [len(records) // 4]).tofile(fd)
+    records.tofile(fd)
+
+
+def read_snapshot(fd):
+    """
+    Reads a snapshot file, returns its (records, timestamp), or (None, None)
+    if the file is empty or truncated
+    """
+    stamp = array.array('d')
+    count = array.array('I')
+    records = array.array('I')
+    try:
+        stamp.fromfile(fd, 1)
+        count.fromfile(fd, 1)
+        records.fromfile(fd, count[0] * 4)
+    except EOFError:
+        return None, None
+    return records, stamp[0]
+
+
+def diff_snapshots(old, new, elapsed):
+    """
+    Compares two snapshots with a single merge of their sorted records, and
+    returns the (prefix, masklen, next hop) lists of routes added, withdrawn,
+    and flapped: present in both, but younger than the `elapsed` seconds
+    between snapshots, so withdrawn and learned again in between. Parsers
+    report unknown route ages as 0: such routes are never taken as flapped.
+    """
+    added = []
+    withdrawn = []
+    flapped = []
+    i, j = 0, 0
+    old_end, new_end = len(old), len(new)
+    while i < old_end and j < new_end:
+        old_key = (old[i] << 38) | (old[i + 1] << 32) | old[i + 2]
+        new_key = (new[j] << 38) | (new[j + 1] << 32) | new[j + 2]
+        if old_key < new_key:
+            withdrawn.append(tuple(old[i:i + 3]))
+            i += 4
+        elif old_key > new_key:
+            added.append(tuple(new[j:j + 3]))
+            j += 4
+        else:
+            if 0 < new[j + 3] < elapsed:
+                flapped.append(tuple(new[j:j + 3]))
+            i += 4
+            j += 4
+    withdrawn.extend(tuple(old[k:k + 3]) for k in range(i, old_end, 4))
+    added.extend(tuple(new[k:k + 3]) for k in range(j, new_end, 4))
+    return added, withdrawn, flapped
+
+
+def record_text(prefix, masklen, nexthop):
+    return "{}/{} via {}".format(int_to_ip(prefix), masklen, int_to_ip(nexthop))
+
+
+class _TrieNode(object):
+    __slots__ = ('prefix', 'masklen', 'children', 'required', 'matched', 'aggregated')
+
+    def __init__(self, prefix, masklen, required=False):
+        self.prefix = prefix
+        self.masklen = masklen
+        self.children = [None, None]
+        self.required = required
+        # a route lies within this prefix, or covers it and all its subtree
+        self.matched = False
+        self.aggregated = False
+
+
+def _common_length(a, b):
+    return 32 - (a ^ b).bit_length()
+
+
+def _mask(masklen):
+    return (0xffffffff << (32 - masklen)) & 0xffffffff
+
+
+class PrefixTrie(object):
+    """
+    Binary radix (Patricia) trie of required prefixes, to check which ones
+    are covered by the routes of a table: by a route of the same prefix, by
+    a route aggregating it, or by a more specific route within it. A default
+    route does not cover anything. Each route is matched by walking the
+    branching nodes along its prefix only.
+    """
+
+    def __init__(self):
+        self.root = _TrieNode(0, 0)
+        self.count = 0
+
+    def insert(self, prefix, masklen):
+        prefix &= _mask(masklen)
+        node = self.root
+        while True:
+            if node.masklen == masklen:
+                if not node.required:
+                    node.required = True
+                    self.count += 1
+                return
+            bit = prefix >> (31 - node.masklen) & 1
+            child = node.children[bit]
+            if child is None:
+                node.children[bit] = _TrieNode(prefix, masklen, True)
+                self.count += 1
+                return
+            common = min(child.masklen, masklen, _common_length(child.prefix, prefix))
+            if common == child.masklen:
+                node = child
+                continue
+            # split the branch at the first differing bit
+            fork = _TrieNode(prefix & _mask(common), common)
+            node.children[bit] = fork
+            fork.children[child.prefix >> (31 - common) & 1] = child
+            if common == masklen:
+                fork.required = True
+            else:
+                fork.children[prefix >> (31 - common) & 1] = _TrieNode(prefix, masklen, True)
+            self.count += 1
+            return
+
+    def match(self, routes):
+        """
+        Marks the required prefixes covered by `routes`
+        """
+        root = self.root
+        for route in routes:
+            prefix, masklen = route.prefix, route.masklen
+            if masklen == 0:
+                continue
+            node = root
+            while node is not None:
+                if node.masklen >= masklen:
+                    # node is the route prefix, or a more specific one: the
+                    # route covers it if it lies within the route
+                    if (node.prefix ^ prefix) >> (32 - masklen) == 0:
+                        node.aggregated = True
+                    break
+                if node.masklen and (node.prefix ^ prefix) >> (32 - node.masklen):
+                    break
+                node.matched = True
+                node = node.children[prefix >> (31 - node.masklen) & 1]
+
+    def uncovered(self):
+        """
+        Returns the sorted (prefix, masklen) list of required prefixes not
+        covered by the routes matched so far
+        """
+        missing = []
+        stack = [(self.root, False)]
+        while stack:
+            node, aggregated = stack.pop()
+            aggregated = aggregated or node.aggregated
+            if node.required and not (aggregated or node.matched):
+                missing.append((node.prefix, node.masklen))
+            for child in node.children:
+                if child is not None:
+                    stack.append((child, aggregated))
+        return sorted(missing)
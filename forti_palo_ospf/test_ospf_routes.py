@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim: expandtab sw=4 ts=4:
+"""
+Tests of the ospf_routes snapshots diff: run with `python -m unittest
+test_ospf_routes` from this directory.
+Published under MIT license
+"""
+
+import io, unittest
+import ospf_routes
+
+__author__ = 'Eric Belhomme'
+__contact__ = 'rico-github@ricozome.net'
+__license__ = 'MIT'
+
+
+def panos_response(entries):
+    """
+    Returns a PAN-OS XML response to `show routing route type ospf` holding
+    the `entries` XML fragments
+    """
+    return io.BytesIO(('<response status="success"><result>{}</result></response>'.format("".join(entries))).encode('utf-8'))
+
+
+def panos_entry(destination, age=None):
+    return ('<entry><destination>{}</destination><nexthop>10.0.0.1</nexthop><metric>10</metric>'
+        '<flags>A Oi</flags>{}<interface>ae1</interface></entry>').format(
+        destination, '' if age is None else '<age>{}</age>'.format(age))
+
+
+class DiffSnapshotsTest(unittest.TestCase):
+
+    def diff(self, previous, current, elapsed):
+        old = ospf_routes.snapshot(ospf_routes.parse_paloalto_xml(panos_response(previous)))
+        new = ospf_routes.snapshot(ospf_routes.parse_paloalto_xml(panos_response(current)))
+        return ospf_routes.diff_snapshots(old, new, elapsed)
+
+    def test_young_route_flapped(self):
+        added, withdrawn, flapped = self.diff([panos_entry('10.1.0.0/16', 5000)],
+            [panos_entry('10.1.0.0/16', 60)], 300)
+        self.assertEqual((added, withdrawn), ([], []))
+        self.assertEqual([ospf_routes.record_text(*record) for record in flapped], ['10.1.0.0/16 via 10.0.0.1'])
+
+    def test_old_route_not_flapped(self):
+        added, withdrawn, flapped = self.diff([panos_entry('10.1.0.0/16', 5000)],
+            [panos_entry('10.1.0.0/16', 5300)], 300)
+        self.assertEqual((added, withdrawn, flapped), ([], [], []))
+
+    def test_missing_age_not_flapped(self):
+        entries = [panos_entry('10.1.0.0/16'), panos_entry('10.2.0.0/16')]
+        added, withdrawn, flapped = self.diff(entries, entries, 300)
+        self.assertEqual((added, withdrawn, flapped), ([], [], []))
+
+    def test_missing_install_date_not_flapped(self):
+        response = b'{"results": [{"type": "ospf", "sub_type": "", "ip_mask": "10.1.0.0/16", ' \
+            b'"gateway": "10.0.0.1", "interface": "port1", "metric": 10}], "status": "success"}'
+        old = ospf_routes.snapshot(ospf_routes.parse_fortinet_json(io.BytesIO(response), 1000000))
+        new = ospf_routes.snapshot(ospf_routes.parse_fortinet_json(io.BytesIO(response), 1000300))
+        self.assertEqual(len(new), 4)
+        self.assertEqual(ospf_routes.diff_snapshots(old, new, 300), ([], [], []))
+
+
+if __name__ == '__main__':
+    unittest.main()